@@ -1,19 +1,74 @@
-import random
+import os
+
+from move import Move
+from bitboard import COLORS
+from search import Search
+from parallel_search import ParallelSearch
+from book import OpeningBook
+from endgame import EndgameTables
+from transposition import TranspositionTable
+from evaluation import EVALUATIONS
+from const import *
+from profiler import TIMERS
 
 class AI:
-    def __init__(self, color):
+    def __init__(self, color, time_limit=AI_TIME_LIMIT, max_depth=AI_MAX_DEPTH, max_nodes=None, tt_size_mb=TT_SIZE_MB, workers=AI_WORKERS, book_path=BOOK_PATH, table_dir=TABLE_DIR, evaluation='default'):
         self.color = color
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        # more than one worker splits the root moves across processes
+        evaluate = EVALUATIONS[evaluation]
+        if workers > 1:
+            self.engine = ParallelSearch(workers, tt_size_mb, evaluate)
+        else:
+            self.engine = Search(TranspositionTable(tt_size_mb), evaluate=evaluate)
+        # the opening book is optional, build it with book.py
+        self.book = OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
+        # endgame tables load on first use, build them with endgame.py
+        self.tables = EndgameTables(table_dir)
+        self.source = None # where the last move came from: 'book', 'tables' or 'search'
 
+    @TIMERS.timed('ai')
     def get_move(self, board):
-        # Get all possible moves for the AI's color
-        all_moves = self.get_all_moves(board, self.color)
-        
-        if not all_moves:
+        # Search a copy of the position (the board keeps the side to move)
+        code = self.search(board.position.copy())
+
+        if code is None:
+            return None
+
+        return self.to_move(board, code)
+
+    def search(self, position, ponder=False):
+        # Packed best move for a position snapshot, None if it is not our turn;
+        # a ponder search has no time limit and runs until it is stopped
+        if position.side != COLORS[self.color]:
+            return None
+        if self.book is not None:
+            code = self.book.choose(position)
+            if code is not None:
+                self.source = 'book'
+                return code
+        code = self.tables.best_move(position)
+        if code is not None:
+            self.source = 'tables'
+            return code
+        self.source = 'search'
+        time_limit = None if ponder else self.time_limit
+        return self.engine.search(position, self.max_depth, time_limit, self.max_nodes)
+
+    def predict(self, position, code):
+        # Expected reply to our move code from the searched line, None
+        # without one; position is the one after the move
+        pv = self.engine.pv
+        if self.source != 'search' or len(pv) < 2 or pv[0] != code:
             return None
-        
-        # Select a random move from all possible moves
-        move = random.choice(all_moves)
-        return move
+        reply = pv[1]
+        return reply if reply in position.legal_moves() else None
+
+    def to_move(self, board, code):
+        # Build the board Move for a packed engine move
+        return Move.from_code(code, board)
 
     def get_all_moves(self, board, color):
         moves = []
@@ -24,6 +79,6 @@ class AI:
                     piece = square.piece
                     if piece.color == color:
                         # Calculate valid moves for the piece
-                        piece_moves = board.calc_moves(piece, row, col, check_for_check=True)
-                        moves.extend(piece_moves)
+                        board.calc_moves(piece, row, col, bool=True)
+                        moves.extend(piece.moves)
         return moves
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from const import *
+from ai import AI
+from bitboard import Position, COLOR_NAMES
+from move import to_uci
+from search import MATE
+from evaluation import PAWN_TABLE
+
+# AI of the current worker process, built once by _init_worker
+_worker_ai = None
+
+def _init_worker(time_limit, max_depth, max_nodes, tt_size_mb, book_path):
+    global _worker_ai
+    _worker_ai = AI('white', time_limit, max_depth, max_nodes, tt_size_mb, workers=1, book_path=book_path)
+
+def read_fens(lines):
+    '''
+        FENs from text lines; blank lines and # comments are skipped and
+        anything after the sixth field (EPD operations, ids) is dropped
+    '''
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield ' '.join(line.split()[:6])
+
+def analyse(fen):
+    '''
+        JSON-ready result of analysing one FEN with the worker's AI
+    '''
+    try:
+        return _analyse(fen)
+    except Exception as error:
+        # one bad position must not end the whole batch
+        return {'fen': fen, 'error': f'{type(error).__name__}: {error}'}
+
+def _analyse(fen):
+    ai = _worker_ai
+    try:
+        position = Position.from_fen(fen)
+    except ValueError as error:
+        return {'fen': fen, 'error': str(error)}
+
+    # every position starts from an empty table so results do not depend
+    # on which positions a worker analysed before
+    ai.color = COLOR_NAMES[position.side]
+    ai.engine.tt.clear()
+    PAWN_TABLE.clear()
+    start = time.perf_counter()
+    code = ai.search(position.copy())
+    result = {'fen': fen, 'bestmove': to_uci(code) if code is not None else None, 'source': ai.source}
+
+    if ai.source == 'search':
+        result.update(score=ai.engine.score, depth=ai.engine.depth, nodes=ai.engine.nodes,
+                      pv=[to_uci(move) for move in ai.engine.pv],
+                      hashfull=ai.engine.tt.hashfull(), pawn_hit_rate=round(PAWN_TABLE.hit_rate(), 3))
+    elif ai.source == 'tables':
+        outcome, plies = ai.tables.probe(position)
+        result['score'] = outcome * (MATE - plies) if outcome else 0
+    result['time'] = round(time.perf_counter() - start, 3)
+    return result
+
+def run(fens, out, workers=None, time_limit=None, max_depth=AI_MAX_DEPTH, max_nodes=None,
+        tt_size_mb=TT_SIZE_MB, book_path=None):
+    '''
+        Analyse FENs in a process pool and write one JSON line per FEN to
+        out, in input order, as soon as each result is ready. Only a few
+        positions per worker are read ahead, so input streams through
+    '''
+    window = 2 * (workers or os.cpu_count() or 1)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(time_limit, max_depth, max_nodes, tt_size_mb, book_path)) as pool:
+        for fen in fens:
+            pending.append(pool.submit(analyse, fen))
+            if len(pending) >= window:
+                _write(out, pending.popleft().result())
+        while pending:
+            _write(out, pending.popleft().result())
+
+def _write(out, result):
+    out.write(json.dumps(result) + '\n')
+    out.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Analyse FEN positions in bulk, one JSON line per position')
+    parser.add_argument('file', nargs='?', help='file of FENs, one per line (default stdin)')
+    parser.add_argument('--workers', type=int, help='analysis processes (default one per CPU)')
+    parser.add_argument('--depth', type=int, help=f'maximum search depth (default {AI_MAX_DEPTH} with --time or --nodes)')
+    parser.add_argument('--time', type=float, help='seconds per position')
+    parser.add_argument('--nodes', type=int, help='nodes per position')
+    parser.add_argument('--tt-size-mb', type=float, default=TT_SIZE_MB)
+    parser.add_argument('--book', help='opening book to consult first')
+    args = parser.parse_args()
+
+    if args.time is None and args.nodes is None and args.depth is None:
+        parser.error('give a budget: --depth, --time or --nodes')
+
+    source = open(args.file) if args.file else sys.stdin
+    try:
+        run(read_fens(source), sys.stdout, args.workers, args.time,
+            AI_MAX_DEPTH if args.depth is None else args.depth, args.nodes,
+            args.tt_size_mb, args.book)
+    finally:
+        if args.file:
+            source.close()
@@ -0,0 +1,335 @@
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from const import *
+from ai import AI
+from bitboard import Position, COLOR_NAMES, WHITE, KNIGHT, BISHOP, popcount
+from book import read_lines, START_FEN
+from endgame import EndgameTables
+from move import to_uci
+from pgn import san, format_game
+from search import MATE_BOUND
+
+# adjudication defaults: resign when both engines agree one side is this far
+# ahead for RESIGN_MOVES moves each, agree a draw once the score stays this
+# close to zero for DRAW_MOVES moves each after move DRAW_START
+RESIGN_SCORE = 800
+RESIGN_MOVES = 4
+DRAW_SCORE = 10
+DRAW_MOVES = 8
+DRAW_START = 40
+MAX_PLIES = 400
+
+# engine options as written on the command line -> AI keyword arguments
+ENGINE_OPTIONS = {
+    'depth': ('max_depth', int),
+    'time': ('time_limit', float),
+    'nodes': ('max_nodes', int),
+    'eval': ('evaluation', str),
+    'tt': ('tt_size_mb', float),
+    'book': ('book_path', str),
+    'tables': ('table_dir', str),
+}
+
+def parse_engine(spec):
+    '''
+        AI keyword arguments from "depth=4,time=0.1,eval=material"; the book
+        is off unless given, openings are randomized by the arena instead.
+        Without a depth, time or node budget the engine gets AI_TIME_LIMIT
+        per move, otherwise it would search to AI_MAX_DEPTH and never move
+    '''
+    options = {'time_limit': None, 'book_path': None, 'workers': 1}
+    for item in filter(None, spec.split(',')):
+        name, _, value = item.partition('=')
+        if name not in ENGINE_OPTIONS:
+            raise ValueError(f'unknown engine option {name!r} in {spec!r}')
+        key, convert = ENGINE_OPTIONS[name]
+        options[key] = convert(value)
+    if all(options.get(key) is None for key in ('max_depth', 'time_limit', 'max_nodes')):
+        options['time_limit'] = AI_TIME_LIMIT
+    return options
+
+def describe(options):
+    # option string of an engine, the reverse of parse_engine
+    names = {key: name for name, (key, _) in ENGINE_OPTIONS.items()}
+    return ','.join(f'{names[key]}={value}' for key, value in options.items()
+                    if key in names and value is not None)
+
+# engines and adjudication rules of the current worker process
+_worker_engines = None
+_worker_rules = None
+_worker_tables = None
+
+def _init_worker(engines, rules, table_dir):
+    global _worker_engines, _worker_rules, _worker_tables
+    _worker_engines = {name: AI('white', **options) for name, options in engines.items()}
+    _worker_rules = rules
+    _worker_tables = EndgameTables(table_dir) if table_dir else None
+
+def insufficient_material(position):
+    # bare kings, or a king and a single minor piece against a king
+    count = popcount(position.occupancy[0] | position.occupancy[1])
+    if count == 2:
+        return True
+    if count == 3:
+        bbs = position.bitboards
+        return any(bbs[color * 6 + ptype] for color in (0, 1) for ptype in (KNIGHT, BISHOP))
+    return False
+
+def play_game(index, opening, white):
+    '''
+        Play one game from an opening (UCI moves) with engine white ('A'
+        or 'B') as white; returns the game record
+    '''
+    engines, rules = _worker_engines, _worker_rules
+    black = 'B' if white == 'A' else 'A'
+    players = (white, black)
+    stats = {name: {'moves': 0, 'nodes': 0, 'time': 0.0, 'search_time': 0.0} for name in engines}
+
+    position = Position.from_fen(START_FEN)
+    for uci in opening:
+        legal = {to_uci(code): code for code in position.legal_moves()}
+        position.make_move(legal[uci])
+    # every game starts with empty tables so results do not depend on the
+    # games a worker happened to play before
+    for ai in engines.values():
+        ai.engine.tt.clear()
+
+    seen = {position.hash: 1}
+    moves = []
+    resign_count = draw_count = resign_sign = 0
+    result = reason = None
+    while result is None:
+        if not position.legal_moves():
+            if position.in_check(position.side):
+                result, reason = ('0-1' if position.side == WHITE else '1-0'), 'checkmate'
+            else:
+                result, reason = '1/2-1/2', 'stalemate'
+            break
+        if position.halfmove >= 100:
+            result, reason = '1/2-1/2', 'fifty moves'
+            break
+        if seen[position.hash] >= 3:
+            result, reason = '1/2-1/2', 'repetition'
+            break
+        if insufficient_material(position):
+            result, reason = '1/2-1/2', 'insufficient material'
+            break
+        if len(moves) >= rules['max_plies']:
+            result, reason = '1/2-1/2', 'move limit'
+            break
+        if _worker_tables is not None:
+            probe = _worker_tables.probe(position)
+            if probe is not None:
+                outcome = probe[0] if position.side == WHITE else -probe[0]
+                result = '1-0' if outcome > 0 else '0-1' if outcome < 0 else '1/2-1/2'
+                reason = 'endgame tables'
+                break
+
+        name = players[position.side]
+        ai = engines[name]
+        ai.color = COLOR_NAMES[position.side]
+        start = time.perf_counter()
+        code = ai.search(position.copy())
+        elapsed = time.perf_counter() - start
+        stats[name]['moves'] += 1
+        stats[name]['time'] += elapsed
+        if ai.source == 'search':
+            stats[name]['nodes'] += ai.engine.nodes
+            stats[name]['search_time'] += elapsed
+
+        # adjudication on the engines' scores, from white's point of view
+        score = None
+        if ai.source == 'search':
+            score = ai.engine.score if position.side == WHITE else -ai.engine.score
+        if score is not None and abs(score) >= rules['resign_score'] and (resign_count == 0 or (score > 0) == (resign_sign > 0)):
+            resign_sign = score
+            resign_count += 1
+        else:
+            resign_count = 0
+        if score is not None and abs(score) <= rules['draw_score'] and len(moves) >= 2 * rules['draw_start']:
+            draw_count += 1
+        else:
+            draw_count = 0
+
+        position.make_move(code)
+        moves.append(to_uci(code))
+        seen[position.hash] = seen.get(position.hash, 0) + 1
+
+        if resign_count >= 2 * rules['resign_moves']:
+            result = '1-0' if resign_sign > 0 else '0-1'
+            reason = 'mate score' if abs(resign_sign) > MATE_BOUND else 'resignation'
+        elif draw_count >= 2 * rules['draw_moves']:
+            result, reason = '1/2-1/2', 'draw agreed'
+
+    return {'index': index, 'white': white, 'black': black, 'opening': opening,
+            'result': result, 'reason': reason, 'plies': len(moves), 'moves': moves, 'stats': stats}
+
+def make_openings(lines, games, plies, rng):
+    '''
+        Openings for the match: random book lines cut to plies moves, each
+        used twice so both engines play both colors; returns (opening,
+        white) pairs
+    '''
+    lines = [line[:plies] for line in lines] or [[]]
+    tasks = []
+    for pair in range((games + 1) // 2):
+        opening = rng.choice(lines)
+        tasks.append((opening, 'A'))
+        tasks.append((opening, 'B'))
+    return tasks[:games]
+
+def elo(score):
+    if score <= 0.0:
+        return -math.inf
+    if score >= 1.0:
+        return math.inf
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+def summary(games):
+    '''
+        Aggregate game records into results for engine A: wins, draws,
+        losses, score, Elo difference with a 95% margin, termination
+        reasons and per-engine speed
+    '''
+    wins = draws = losses = 0
+    reasons = {}
+    totals = {'A': {'moves': 0, 'nodes': 0, 'time': 0.0, 'search_time': 0.0},
+              'B': {'moves': 0, 'nodes': 0, 'time': 0.0, 'search_time': 0.0}}
+    for game in games:
+        if game['result'] == '1/2-1/2':
+            draws += 1
+        elif (game['result'] == '1-0') == (game['white'] == 'A'):
+            wins += 1
+        else:
+            losses += 1
+        reasons[game['reason']] = reasons.get(game['reason'], 0) + 1
+        for name, stats in game['stats'].items():
+            for key, value in stats.items():
+                totals[name][key] += value
+
+    n = wins + draws + losses
+    score = (wins + draws / 2) / n if n else 0.5
+    # standard error of the mean game score, then the 95% interval in Elo
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n if n else 0.0
+    margin = 1.96 * math.sqrt(variance / n) if n else 0.0
+    low, high = elo(max(score - margin, 0.0)), elo(min(score + margin, 1.0))
+
+    engines = {}
+    for name, stats in totals.items():
+        engines[name] = {
+            'nodes_per_second': stats['nodes'] / stats['search_time'] if stats['search_time'] else 0.0,
+            'average_move_time': stats['time'] / stats['moves'] if stats['moves'] else 0.0,
+        }
+    return {'games': n, 'wins': wins, 'draws': draws, 'losses': losses, 'score': score,
+            'elo': elo(score),
+            'elo_margin': (high - low) / 2 if math.isfinite(high - low) else math.inf, 'reasons': reasons, 'engines': engines}
+
+def run(engines, games, workers=None, rules=None, openings=(), opening_plies=8, seed=None,
+        table_dir=TABLE_DIR, out=None, pgn=None, progress=sys.stderr):
+    '''
+        Play a match between engine options engines['A'] and engines['B']
+        in a process pool and return the summary; game records are written
+        to out as JSON lines and to pgn as PGN when given
+    '''
+    rules = dict(rules or {})
+    for name, value in (('resign_score', RESIGN_SCORE), ('resign_moves', RESIGN_MOVES),
+                        ('draw_score', DRAW_SCORE), ('draw_moves', DRAW_MOVES),
+                        ('draw_start', DRAW_START), ('max_plies', MAX_PLIES)):
+        rules.setdefault(name, value)
+    tasks = make_openings(list(openings), games, opening_plies, random.Random(seed))
+
+    records = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(engines, rules, table_dir)) as pool:
+        futures = [pool.submit(play_game, index, opening, white)
+                   for index, (opening, white) in enumerate(tasks)]
+        for future in as_completed(futures):
+            game = future.result()
+            records.append(game)
+            if out is not None:
+                out.write(json.dumps(game) + '\n')
+                out.flush()
+            if pgn is not None:
+                pgn.write(game_pgn(game, engines))
+                pgn.flush()
+            if progress is not None:
+                current = summary(records)
+                progress.write(f'game {len(records)}/{len(tasks)}: {game["white"]}-{game["black"]} '
+                               f'{game["result"]} ({game["reason"]}, {game["plies"]} plies)  '
+                               f'A +{current["wins"]} ={current["draws"]} -{current["losses"]}\n')
+    return summary(records)
+
+def game_pgn(game, engines):
+    '''
+        PGN text of an arena game record
+    '''
+    position = Position.from_fen(START_FEN)
+    moves = []
+    for uci in game['opening'] + game['moves']:
+        legal = position.legal_moves()
+        code = next(code for code in legal if to_uci(code) == uci)
+        moves.append(san(position, code, legal))
+        position.make_move(code)
+    headers = {'Event': 'Arena', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'), 'Round': game['index'] + 1,
+               'White': f'{game["white"]} ({describe(engines[game["white"]])})',
+               'Black': f'{game["black"]} ({describe(engines[game["black"]])})',
+               'Termination': game['reason']}
+    return format_game(headers, moves, game['result'])
+
+def report(result):
+    lines = [
+        f'games {result["games"]}: A wins {result["wins"]}, draws {result["draws"]}, losses {result["losses"]}',
+        f'score {result["score"]:.3f}, Elo difference {result["elo"]:+.1f} +/- {result["elo_margin"]:.1f}',
+        'terminations: ' + ', '.join(f'{reason} {count}' for reason, count in sorted(result['reasons'].items())),
+    ]
+    for name, stats in sorted(result['engines'].items()):
+        lines.append(f'engine {name}: {stats["nodes_per_second"]:.0f} nodes/s, '
+                     f'{stats["average_move_time"]:.3f}s per move')
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Play AI against AI headless and report the match result')
+    parser.add_argument('--a', default='depth=3', help='engine A options, e.g. "depth=4,time=0.1,eval=default"')
+    parser.add_argument('--b', default='depth=3,eval=material', help='engine B options')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, help='game processes (default one per CPU)')
+    parser.add_argument('--openings', default='assests/openings.txt', help='UCI opening lines')
+    parser.add_argument('--opening-plies', type=int, default=8)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--tables', default=TABLE_DIR, help='endgame tables for adjudication ("" for none)')
+    parser.add_argument('--resign-score', type=int, default=RESIGN_SCORE)
+    parser.add_argument('--resign-moves', type=int, default=RESIGN_MOVES)
+    parser.add_argument('--draw-score', type=int, default=DRAW_SCORE)
+    parser.add_argument('--draw-moves', type=int, default=DRAW_MOVES)
+    parser.add_argument('--draw-start', type=int, default=DRAW_START)
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--out', help='write every game as a JSON line to this file')
+    parser.add_argument('--pgn', help='append every game to this PGN file')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    try:
+        engines = {'A': parse_engine(args.a), 'B': parse_engine(args.b)}
+    except ValueError as error:
+        parser.error(str(error))
+    rules = {'resign_score': args.resign_score, 'resign_moves': args.resign_moves,
+             'draw_score': args.draw_score, 'draw_moves': args.draw_moves,
+             'draw_start': args.draw_start, 'max_plies': args.max_plies}
+    openings = list(read_lines(args.openings)) if args.openings else []
+
+    out = open(args.out, 'w') if args.out else None
+    pgn = open(args.pgn, 'a') if args.pgn else None
+    try:
+        result = run(engines, args.games, args.workers, rules, openings, args.opening_plies,
+                     args.seed, args.tables, out, pgn)
+    finally:
+        for f in (out, pgn):
+            if f is not None:
+                f.close()
+    print(json.dumps(result) if args.json else report(result))
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# no window and no sound card needed; set before pygame is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+# keep stdout clean for --json
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+from const import *
+from board import Board
+from game import Game
+from renderer import Renderer
+from profiler import Timers
+from textures import SPRITES
+from pgn import START_FEN
+
+# positions replayed, each with a hover sweep, drags that play moves, a
+# popup message and a theme switch
+POSITIONS = [
+    ('start', START_FEN),
+    ('middlegame', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+]
+
+# calls timed in full mode, in drawing order
+CALLS = ('show_bg', 'show_pieces', 'update_blit', 'popup_update')
+
+def square_center(row, col):
+    return col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
+
+def movable_pieces(board, color):
+    # (piece, row, col) of the pieces of color that have legal moves
+    pieces = []
+    for row in range(ROWS):
+        for col in range(COLS):
+            piece = board.squares[row][col].piece
+            if piece is not None and piece.color == color:
+                board.calc_moves(piece, row, col, bool=True)
+                if piece.moves:
+                    pieces.append((piece, row, col))
+    return pieces
+
+def scenario(game, steps, drags):
+    '''
+        Scripted session on a Game: changes it the way a player would and
+        yields once per frame to draw
+    '''
+    dragger = game.dragger
+    for name, fen in POSITIONS:
+        game.board = Board(fen)
+        game.next_player = 'white' if fen.split()[1] == 'w' else 'black'
+        game.popup.show_message(None, f'Position: {name}')
+        yield
+
+        # mouse over the board
+        for i in range(steps):
+            game.set_hover(i % ROWS, i * 3 % COLS)
+            yield
+
+        # drag pieces to a legal square and drop them there
+        for i in range(drags):
+            pieces = movable_pieces(game.board, game.next_player)
+            if not pieces:
+                break
+            piece, row, col = pieces[i * 7 % len(pieces)]
+            move = piece.moves[i % len(piece.moves)]
+            (x0, y0), (x1, y1) = square_center(row, col), square_center(move.final.row, move.final.col)
+            dragger.update_mouse((x0, y0))
+            dragger.save_initial((x0, y0))
+            dragger.drag_piece(piece)
+            for step in range(1, steps + 1):
+                x, y = x0 + (x1 - x0) * step // steps, y0 + (y1 - y0) * step // steps
+                dragger.update_mouse((x, y))
+                game.set_hover(y // SQSIZE, x // SQSIZE)
+                yield
+            game.board.move(piece, move)
+            game.board.set_true_en_passant(piece)
+            dragger.undrag_piece()
+            game.next_player = 'white' if game.next_player == 'black' else 'black'
+            yield
+
+        game.popup.show_message(None, 'Invalid Move!')
+        yield
+        game.change_theme()
+        yield
+
+def full_frame(game, screen, timers):
+    # everything drawn every frame, the way the game loop used to
+    with timers.stage('show_bg'):
+        game.show_bg(screen)
+    game.show_last_move(screen)
+    game.show_moves(screen)
+    with timers.stage('show_pieces'):
+        game.show_pieces(screen)
+    game.show_hover(screen)
+    game.show_check(screen)
+    if game.dragger.dragging:
+        with timers.stage('update_blit'):
+            game.dragger.update_blit(screen)
+    with timers.stage('popup_update'):
+        game.popup.update(screen)
+    pygame.display.flip()
+
+def run(mode, steps, drags, repeat):
+    '''
+        Replay the scenario repeat times drawing in mode 'full' or 'dirty'
+        (the Renderer); returns frames, seconds and {call: samples}
+    '''
+    screen = pygame.display.get_surface()
+    timers = Timers(size=1 << 20, enabled=True)
+    frames = 0
+    elapsed = 0.0
+    for i in range(repeat):
+        game = Game(microphone=False)
+        renderer = Renderer(game, screen)
+        for _ in scenario(game, steps, drags):
+            start = time.perf_counter()
+            if mode == 'full':
+                full_frame(game, screen, timers)
+            else:
+                with timers.stage('render'):
+                    renderer.render()
+            pygame.event.pump()
+            seconds = time.perf_counter() - start
+            timers.add('frame', seconds)
+            elapsed += seconds
+            frames += 1
+    return frames, elapsed, {name: list(samples) for name, samples in timers.samples.items()}
+
+def summary(mode, frames, elapsed, samples):
+    calls = {}
+    for name, values in samples.items():
+        values = sorted(values)
+        calls[name] = {'calls': len(values),
+                       'mean_ms': sum(values) / len(values) * 1000,
+                       'p50_ms': values[len(values) // 2] * 1000,
+                       'p95_ms': values[min(len(values) - 1, len(values) * 95 // 100)] * 1000}
+    return {'mode': mode, 'frames': frames, 'seconds': elapsed,
+            'fps': frames / elapsed if elapsed else 0.0, 'calls': calls}
+
+def report(result):
+    print(f'{result["mode"]:<6} {result["frames"]} frames in {result["seconds"]:.3f}s, {result["fps"]:.1f} fps')
+    order = [name for name in CALLS + ('render', 'frame') if name in result['calls']]
+    for name in order:
+        call = result['calls'][name]
+        print(f'  {name:<14} {call["calls"]:>6} calls  mean {call["mean_ms"]:7.3f}  '
+              f'p50 {call["p50_ms"]:7.3f}  p95 {call["p95_ms"]:7.3f} ms')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless rendering benchmark (SDL dummy video and audio drivers)')
+    parser.add_argument('--mode', choices=('full', 'dirty', 'both'), default='both',
+                        help='draw everything every frame, only the changed squares, or compare both')
+    parser.add_argument('--steps', type=int, default=30, help='frames per hover sweep and per drag')
+    parser.add_argument('--drags', type=int, default=4, help='moves dragged and played per position')
+    parser.add_argument('--repeat', type=int, default=3, help='times the whole scenario is replayed')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((WIDTH, HEIGHT))
+    SPRITES.preload()
+
+    results = []
+    for mode in (('full', 'dirty') if args.mode == 'both' else (args.mode,)):
+        results.append(summary(mode, *run(mode, args.steps, args.drags, args.repeat)))
+    pygame.quit()
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        for result in results:
+            report(result)
+    sys.exit(0)
@@ -0,0 +1,767 @@
+from const import *
+from piece import PIECE_KINDS
+from evaluation import PIECE_SQUARE_MG, PIECE_SQUARE_EG, PHASE, MATERIAL
+from move import (CAPTURE, DOUBLE_PUSH, EN_PASSANT, KING_CASTLE, QUEEN_CASTLE, PROMOTION,
+                  QUIET, promotion_flags)
+from zobrist import PIECE_KEYS, PAWN_KEYS, SIDE_KEY, CASTLING_KEYS, EP_KEYS
+import zobrist
+
+# colors
+WHITE = 0
+BLACK = 1
+COLORS = {'white': WHITE, 'black': BLACK}
+COLOR_NAMES = ('white', 'black')
+
+# piece types
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+PIECE_TYPES = {'pawn': PAWN, 'knight': KNIGHT, 'bishop': BISHOP, 'rook': ROOK, 'queen': QUEEN, 'king': KING}
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+FEN_PIECES = 'pnbrqk'
+
+# castling rights
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+FULL = (1 << 64) - 1
+
+# squares are indexed row * 8 + col, so index 0 is a8 and index 63 is h1,
+# matching the (row, col) layout of Board.squares
+
+def square_index(row, col):
+    return row * 8 + col
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str(8 - (sq >> 3))
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f'invalid square: {name!r}')
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+def iter_bits(bb):
+    while bb:
+        b = bb & -bb
+        yield b.bit_length() - 1
+        bb ^= b
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+# attack tables
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        bb = 0
+        for drow, dcol in offsets:
+            r, c = row + drow, col + dcol
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)])
+KING_ATTACKS = _leaper_table([(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)])
+PAWN_ATTACKS = (
+    _leaper_table([(-1, -1), (-1, 1)]), # white pawns capture towards row 0
+    _leaper_table([(1, -1), (1, 1)]), # black pawns capture towards row 7
+)
+
+# sliding directions as (drow, dcol); the first four increase the square
+# index, so their nearest blocker is the lowest set bit of the ray
+POSITIVE_DIRS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+NEGATIVE_DIRS = [(-1, 0), (0, -1), (-1, -1), (-1, 1)]
+
+def _ray_table(drow, dcol):
+    table = []
+    for sq in range(64):
+        r, c = (sq >> 3) + drow, (sq & 7) + dcol
+        bb = 0
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + drow, c + dcol
+        table.append(bb)
+    return table
+
+RAYS = {d: _ray_table(*d) for d in POSITIVE_DIRS + NEGATIVE_DIRS}
+
+ROOK_POSITIVE = [RAYS[(1, 0)], RAYS[(0, 1)]]
+ROOK_NEGATIVE = [RAYS[(-1, 0)], RAYS[(0, -1)]]
+BISHOP_POSITIVE = [RAYS[(1, 1)], RAYS[(1, -1)]]
+BISHOP_NEGATIVE = [RAYS[(-1, -1)], RAYS[(-1, 1)]]
+
+def _slide(sq, occ, positive, negative):
+    attacks = 0
+    for rays in positive:
+        ray = rays[sq]
+        blockers = ray & occ
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in negative:
+        ray = rays[sq]
+        blockers = ray & occ
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occ):
+    return _slide(sq, occ, ROOK_POSITIVE, ROOK_NEGATIVE)
+
+def bishop_attacks(sq, occ):
+    return _slide(sq, occ, BISHOP_POSITIVE, BISHOP_NEGATIVE)
+
+def queen_attacks(sq, occ):
+    return rook_attacks(sq, occ) | bishop_attacks(sq, occ)
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for drow, dcol in POSITIVE_DIRS + NEGATIVE_DIRS:
+            r, c = (sq >> 3) + drow, (sq & 7) + dcol
+            bb = 0
+            while 0 <= r < 8 and 0 <= c < 8:
+                table[sq][r * 8 + c] = bb
+                bb |= 1 << (r * 8 + c)
+                r, c = r + drow, c + dcol
+    return table
+
+# squares strictly between two squares on a shared line (0 if not aligned)
+BETWEEN = _between_table()
+
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+
+# castling geometry: (right, king from, king to, rook from, rook to, must be empty, must not be attacked)
+CASTLING = (
+    (WHITE_KINGSIDE, 60, 62, 63, 61, (1 << 61) | (1 << 62), (60, 61, 62)),
+    (WHITE_QUEENSIDE, 60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), (60, 59, 58)),
+    (BLACK_KINGSIDE, 4, 6, 7, 5, (1 << 5) | (1 << 6), (4, 5, 6)),
+    (BLACK_QUEENSIDE, 4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), (4, 3, 2)),
+)
+
+# rook (from, to) of a castling move, by the king's final square
+CASTLING_ROOKS = {king_to: (rook_from, rook_to) for _, _, king_to, rook_from, rook_to, _, _ in CASTLING}
+
+# castling rights lost when a piece leaves or lands on a square
+CASTLING_MASK = [0] * 64
+CASTLING_MASK[60] = WHITE_KINGSIDE | WHITE_QUEENSIDE
+CASTLING_MASK[63] = WHITE_KINGSIDE
+CASTLING_MASK[56] = WHITE_QUEENSIDE
+CASTLING_MASK[4] = BLACK_KINGSIDE | BLACK_QUEENSIDE
+CASTLING_MASK[7] = BLACK_KINGSIDE
+CASTLING_MASK[0] = BLACK_QUEENSIDE
+
+# rows 0 and 7, where no pawn can stand
+BACK_RANKS = 0xFF | (0xFF << 56)
+
+# promotion flags, queen first
+PROMOTIONS = tuple(promotion_flags(ptype) << 12 for ptype in (QUEEN, ROOK, BISHOP, KNIGHT))
+PROMOTION_CAPTURES = tuple(flags | (CAPTURE << 12) for flags in PROMOTIONS)
+
+# piece values for static exchange evaluation; the king outweighs any
+# exchange, it only ever takes last
+SEE_VALUES = MATERIAL[:KING] + [20000]
+
+class Position:
+    '''
+        Bitboard position core: one 64-bit board per (color, piece type),
+        plus a mailbox so the piece on a square can be read without scanning
+    '''
+
+    def __init__(self):
+        self.bitboards = [0] * 12 # index color * 6 + piece type
+        self.occupancy = [0, 0]
+        self.mailbox = [None] * 64
+        self.side = WHITE
+        self.castling = 0
+        self.ep = None # square a pawn may capture onto en passant
+        self.halfmove = 0
+        self.fullmove = 1
+        self.hash = 0 # Zobrist key, kept up to date by put/remove/make_move
+        self.pawn_hash = 0 # Zobrist key of the pawns alone, kept by put/remove
+        # incremental evaluation terms (white positive), kept by put/remove
+        self.mg = 0
+        self.eg = 0
+        self.phase = 0
+        self.material = [0, 0]
+
+    @classmethod
+    def from_board(cls, board, side=WHITE):
+        position = cls()
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board.squares[row][col].piece
+                if piece is not None:
+                    position.put(*divmod(piece.kind.code, 6), row * 8 + col)
+
+        # castling rights from the moved flags of kings and rooks
+        for right, king_from, _, rook_from, _, _, _ in CASTLING:
+            king = board.squares[king_from >> 3][king_from & 7].piece
+            rook = board.squares[rook_from >> 3][rook_from & 7].piece
+            if king is None or rook is None or king.name != 'king' or rook.name != 'rook':
+                continue
+            if king.color != rook.color or COLORS[king.color] != (0 if king_from == 60 else 1):
+                continue
+            if not king.moved and not rook.moved:
+                position.castling |= right
+
+        # en passant square behind a pawn that has just made a double step
+        for col in range(COLS):
+            for row, behind in ((4, 5), (3, 2)):
+                piece = board.squares[row][col].piece
+                if piece is not None and piece.name == 'pawn' and piece.en_passant:
+                    if (piece.color == 'white') == (row == 4) and COLORS[piece.color] != side:
+                        if PAWN_ATTACKS[COLORS[piece.color]][behind * 8 + col] & position.bitboards[side * 6 + PAWN]:
+                            position.ep = behind * 8 + col
+
+        position.side = side
+        position.hash = zobrist.compute(position)
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f'invalid FEN: {fen!r}')
+        position = cls()
+
+        rows = fields[0].split('/')
+        if len(rows) != ROWS:
+            raise ValueError(f'invalid FEN board: {fields[0]!r}')
+        for row, rank in enumerate(rows):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                elif char.lower() in FEN_PIECES and col < COLS:
+                    position.put(WHITE if char.isupper() else BLACK, FEN_PIECES.index(char.lower()), row * 8 + col)
+                    col += 1
+                else:
+                    raise ValueError(f'invalid FEN board: {fields[0]!r}')
+            if col != COLS:
+                raise ValueError(f'invalid FEN board: {fields[0]!r}')
+
+        for color in COLORS.values():
+            if popcount(position.bitboards[color * 6 + KING]) != 1:
+                raise ValueError(f'invalid FEN board, needs one king per side: {fields[0]!r}')
+            if position.bitboards[color * 6 + PAWN] & BACK_RANKS:
+                raise ValueError(f'invalid FEN board, pawn on the first or last rank: {fields[0]!r}')
+
+        if fields[1] not in ('w', 'b'):
+            raise ValueError(f'invalid FEN side to move: {fields[1]!r}')
+        position.side = WHITE if fields[1] == 'w' else BLACK
+        if position.in_check(position.side ^ 1):
+            raise ValueError(f'invalid FEN, the side not to move is in check: {fen!r}')
+
+        for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if char in fields[2]:
+                position.castling |= right
+        # rights without the king and rook on their home squares are dropped
+        for right, king_from, _, rook_from, _, _, _ in CASTLING:
+            color = WHITE if king_from == 60 else BLACK
+            if position.mailbox[king_from] != color * 6 + KING or position.mailbox[rook_from] != color * 6 + ROOK:
+                position.castling &= ~right
+
+        if fields[3] != '-':
+            ep = parse_square(fields[3])
+            # the pawn that just made a double step stands in front of it
+            them = position.side ^ 1
+            pawn = ep + 8 if them == BLACK else ep - 8
+            if (ep >> 3 != (2 if them == BLACK else 5) or position.mailbox[ep] is not None
+                    or position.mailbox[pawn] != them * 6 + PAWN):
+                raise ValueError(f'invalid FEN en passant square: {fields[3]!r}')
+            # same rule as make_move: only kept when a pawn can take
+            if PAWN_ATTACKS[position.side ^ 1][ep] & position.bitboards[position.side * 6 + PAWN]:
+                position.ep = ep
+
+        # the move counters are optional, each on its own
+        if len(fields) >= 5:
+            if not fields[4].isdigit():
+                raise ValueError(f'invalid FEN halfmove clock: {fields[4]!r}')
+            position.halfmove = int(fields[4])
+        if len(fields) >= 6:
+            if not fields[5].isdigit() or int(fields[5]) < 1:
+                raise ValueError(f'invalid FEN fullmove number: {fields[5]!r}')
+            position.fullmove = int(fields[5])
+
+        position.hash = zobrist.compute(position)
+        return position
+
+    def fen(self):
+        rows = []
+        for row in range(ROWS):
+            rank, empty = '', 0
+            for col in range(COLS):
+                code = self.mailbox[row * 8 + col]
+                if code is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                char = FEN_PIECES[code % 6]
+                rank += char.upper() if code < 6 else char
+            rows.append(rank + (str(empty) if empty else ''))
+
+        castling = ''.join(char for char, right in zip('KQkq', (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE))
+                           if self.castling & right) or '-'
+        ep = square_name(self.ep) if self.ep is not None else '-'
+        side = 'w' if self.side == WHITE else 'b'
+        return f'{"/".join(rows)} {side} {castling} {ep} {self.halfmove} {self.fullmove}'
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.bitboards = self.bitboards[:]
+        position.occupancy = self.occupancy[:]
+        position.mailbox = self.mailbox[:]
+        position.side = self.side
+        position.castling = self.castling
+        position.ep = self.ep
+        position.halfmove = self.halfmove
+        position.fullmove = self.fullmove
+        position.hash = self.hash
+        position.pawn_hash = self.pawn_hash
+        position.mg = self.mg
+        position.eg = self.eg
+        position.phase = self.phase
+        position.material = self.material[:]
+        return position
+
+    def put(self, color, ptype, sq):
+        bit = 1 << sq
+        code = color * 6 + ptype
+        self.bitboards[code] |= bit
+        self.occupancy[color] |= bit
+        self.mailbox[sq] = code
+        self.hash ^= PIECE_KEYS[code][sq]
+        self.pawn_hash ^= PAWN_KEYS[code][sq]
+        self.mg += PIECE_SQUARE_MG[code][sq]
+        self.eg += PIECE_SQUARE_EG[code][sq]
+        self.phase += PHASE[ptype]
+        self.material[color] += MATERIAL[ptype]
+
+    def remove(self, sq):
+        code = self.mailbox[sq]
+        bit = 1 << sq
+        self.bitboards[code] ^= bit
+        self.occupancy[code // 6] ^= bit
+        self.mailbox[sq] = None
+        self.hash ^= PIECE_KEYS[code][sq]
+        self.pawn_hash ^= PAWN_KEYS[code][sq]
+        self.mg -= PIECE_SQUARE_MG[code][sq]
+        self.eg -= PIECE_SQUARE_EG[code][sq]
+        self.phase -= PHASE[code % 6]
+        self.material[code // 6] -= MATERIAL[code % 6]
+        return code
+
+    def piece_at(self, sq):
+        '''
+            Shared PieceKind on a square, or None
+        '''
+        code = self.mailbox[sq]
+        return None if code is None else PIECE_KINDS[code]
+
+    def king_square(self, color):
+        return lsb(self.bitboards[color * 6 + KING])
+
+    def is_attacked(self, sq, by_color, occ=None):
+        bbs = self.bitboards
+        base = by_color * 6
+        if occ is None:
+            occ = self.occupancy[0] | self.occupancy[1]
+        if PAWN_ATTACKS[by_color ^ 1][sq] & bbs[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bbs[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & bbs[base + KING]:
+            return True
+        queens = bbs[base + QUEEN]
+        if bishop_attacks(sq, occ) & (bbs[base + BISHOP] | queens):
+            return True
+        if rook_attacks(sq, occ) & (bbs[base + ROOK] | queens):
+            return True
+        return False
+
+    def attackers_to(self, sq, occ=None):
+        '''
+            Bitboard of the pieces of both colors attacking a square
+        '''
+        bbs = self.bitboards
+        if occ is None:
+            occ = self.occupancy[0] | self.occupancy[1]
+        rooks = bbs[ROOK] | bbs[QUEEN] | bbs[6 + ROOK] | bbs[6 + QUEEN]
+        bishops = bbs[BISHOP] | bbs[QUEEN] | bbs[6 + BISHOP] | bbs[6 + QUEEN]
+        return ((PAWN_ATTACKS[BLACK][sq] & bbs[PAWN])
+                | (PAWN_ATTACKS[WHITE][sq] & bbs[6 + PAWN])
+                | (KNIGHT_ATTACKS[sq] & (bbs[KNIGHT] | bbs[6 + KNIGHT]))
+                | (KING_ATTACKS[sq] & (bbs[KING] | bbs[6 + KING]))
+                | (bishop_attacks(sq, occ) & bishops)
+                | (rook_attacks(sq, occ) & rooks)) & occ
+
+    def see(self, move):
+        '''
+            Static exchange evaluation: material the side to move wins (or
+            loses, when negative) on the target square if both sides keep
+            recapturing with their least valuable piece while it pays.
+            Sliders behind an exchanged piece join in as x-rays
+        '''
+        frm = move & 63
+        to = (move >> 6) & 63
+        flags = move >> 12
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            return 0
+        bbs = self.bitboards
+        occ = self.occupancy[0] | self.occupancy[1]
+        side = self.mailbox[frm] // 6
+
+        # gain[d] is what the side making capture d has won so far
+        if flags == EN_PASSANT:
+            gain = [SEE_VALUES[PAWN]]
+            occ ^= 1 << (to + (8 if side == WHITE else -8))
+        else:
+            victim = self.mailbox[to]
+            gain = [SEE_VALUES[victim % 6] if victim is not None else 0]
+        attacker = SEE_VALUES[self.mailbox[frm] % 6]
+        if flags & PROMOTION:
+            promoted = SEE_VALUES[(flags & 3) + 1]
+            gain[0] += promoted - SEE_VALUES[PAWN]
+            attacker = promoted
+
+        from_bit = 1 << frm
+        while from_bit:
+            gain.append(attacker - gain[-1])
+            # neither side can do better by continuing
+            if max(-gain[-2], gain[-1]) < 0:
+                break
+            occ ^= from_bit
+            attackers = self.attackers_to(to, occ)
+            side ^= 1
+            own = attackers & self.occupancy[side]
+            from_bit = 0
+            for ptype in range(6):
+                bb = own & bbs[side * 6 + ptype]
+                if bb:
+                    from_bit = bb & -bb
+                    attacker = SEE_VALUES[ptype]
+                    break
+            # the king may only take when nothing can take back
+            if from_bit and ptype == KING and attackers & self.occupancy[side ^ 1]:
+                break
+
+        # back up the sequence: each side may also stop capturing (the
+        # last entry assumed a recapture that never came)
+        for d in range(len(gain) - 2, 0, -1):
+            gain[d - 1] = -max(-gain[d - 1], gain[d])
+        return gain[0]
+
+    def in_check(self, color):
+        return self.is_attacked(self.king_square(color), color ^ 1)
+
+    def attacked_squares(self, color, occ=None):
+        '''
+            Bitboard of every square attacked by a color
+        '''
+        bbs = self.bitboards
+        base = color * 6
+        if occ is None:
+            occ = self.occupancy[0] | self.occupancy[1]
+
+        pawns = bbs[base + PAWN]
+        if color == WHITE:
+            attacked = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacked = (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL
+
+        for sq in iter_bits(bbs[base + KNIGHT]):
+            attacked |= KNIGHT_ATTACKS[sq]
+        for sq in iter_bits(bbs[base + BISHOP] | bbs[base + QUEEN]):
+            attacked |= bishop_attacks(sq, occ)
+        for sq in iter_bits(bbs[base + ROOK] | bbs[base + QUEEN]):
+            attacked |= rook_attacks(sq, occ)
+        for sq in iter_bits(bbs[base + KING]):
+            attacked |= KING_ATTACKS[sq]
+        return attacked
+
+    def pins(self, color):
+        '''
+            Pinned pieces of a color mapped to the ray (between king and
+            pinner, pinner included) they may still move along
+        '''
+        bbs = self.bitboards
+        king = self.king_square(color)
+        own = self.occupancy[color]
+        enemy = self.occupancy[color ^ 1]
+        base = (color ^ 1) * 6
+        queens = bbs[base + QUEEN]
+
+        # enemy sliders that would hit the king if only enemy pieces blocked
+        snipers = ((rook_attacks(king, enemy) & (bbs[base + ROOK] | queens))
+                   | (bishop_attacks(king, enemy) & (bbs[base + BISHOP] | queens)))
+        pins = {}
+        for sniper in iter_bits(snipers):
+            between = BETWEEN[king][sniper]
+            blockers = between & (own | enemy)
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pins[lsb(blockers)] = between | (1 << sniper)
+        return pins
+
+    def legal_moves(self, color=None):
+        '''
+            Legal moves of a color (default: side to move). Attacked squares,
+            checkers and pins are computed once, then each pseudo-legal move
+            is accepted or rejected without playing it; only en passant,
+            which can uncover a check along the rank, is tried on the board
+        '''
+        if color is None:
+            color = self.side
+        king = self.king_square(color)
+        enemy = color ^ 1
+        occ = self.occupancy[0] | self.occupancy[1]
+        checkers = self.attackers_to(king, occ) & self.occupancy[enemy]
+
+        # double check: only the king can move
+        if checkers & (checkers - 1):
+            moves = self.generate(color, 1 << king)
+        else:
+            moves = self.generate(color)
+
+        # squares the king may not step on (sliders see through the king)
+        attacked = self.attacked_squares(enemy, occ ^ (1 << king))
+        evasions = checkers | BETWEEN[king][lsb(checkers)] if checkers else FULL
+        pins = self.pins(color)
+        legal = []
+        append = legal.append
+
+        for move in moves:
+            frm = move & 63
+            to = (move >> 6) & 63
+
+            # king moves (castling safety is checked during generation)
+            if frm == king:
+                if move >> 12 in (KING_CASTLE, QUEEN_CASTLE) or not (attacked >> to) & 1:
+                    append(move)
+                continue
+
+            # en passant
+            if move >> 12 == EN_PASSANT:
+                undo = self.make_move(move)
+                if not self.is_attacked(king, enemy):
+                    append(move)
+                self.unmake_move(move, undo)
+                continue
+
+            # pinned pieces stay on their pin ray
+            if frm in pins and not (pins[frm] >> to) & 1:
+                continue
+
+            # in check: capture the checker or block
+            if (evasions >> to) & 1:
+                append(move)
+
+        return legal
+
+    def generate(self, color=None, from_mask=FULL):
+        '''
+            Pseudo-legal moves of a color (default: side to move), optionally
+            restricted to the pieces on from_mask
+        '''
+        if color is None:
+            color = self.side
+        bbs = self.bitboards
+        base = color * 6
+        own = self.occupancy[color]
+        enemy = self.occupancy[color ^ 1]
+        occ = own | enemy
+        empty = FULL ^ occ
+        moves = []
+        append = moves.append
+
+        # pawns
+        pawns = bbs[base + PAWN] & from_mask
+        if pawns:
+            step, start_row, last_row = (-8, 6, 0) if color == WHITE else (8, 1, 7)
+            attacks = PAWN_ATTACKS[color]
+            ep = self.ep if color == self.side else None
+            while pawns:
+                b = pawns & -pawns
+                frm = b.bit_length() - 1
+                pawns ^= b
+                to = frm + step
+                promoting = (to >> 3) == last_row
+                # pushes
+                if not (occ >> to) & 1:
+                    if promoting:
+                        for flags in PROMOTIONS:
+                            append(frm | (to << 6) | flags)
+                    else:
+                        append(frm | (to << 6))
+                        if (frm >> 3) == start_row and not (occ >> (to + step)) & 1:
+                            append(frm | ((to + step) << 6) | (DOUBLE_PUSH << 12))
+                # captures
+                caps = attacks[frm] & enemy
+                while caps:
+                    c = caps & -caps
+                    to = c.bit_length() - 1
+                    caps ^= c
+                    if promoting:
+                        for flags in PROMOTION_CAPTURES:
+                            append(frm | (to << 6) | flags)
+                    else:
+                        append(frm | (to << 6) | (CAPTURE << 12))
+                # en passant
+                if ep is not None and (attacks[frm] >> ep) & 1:
+                    append(frm | (ep << 6) | (EN_PASSANT << 12))
+
+        # knights
+        knights = bbs[base + KNIGHT] & from_mask
+        while knights:
+            b = knights & -knights
+            frm = b.bit_length() - 1
+            knights ^= b
+            attacks = KNIGHT_ATTACKS[frm]
+            for to in iter_bits(attacks & empty):
+                append(frm | (to << 6))
+            for to in iter_bits(attacks & enemy):
+                append(frm | (to << 6) | (CAPTURE << 12))
+
+        # bishops, rooks and queens
+        for ptype, attack in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+            sliders = bbs[base + ptype] & from_mask
+            while sliders:
+                b = sliders & -sliders
+                frm = b.bit_length() - 1
+                sliders ^= b
+                attacks = attack(frm, occ)
+                for to in iter_bits(attacks & empty):
+                    append(frm | (to << 6))
+                for to in iter_bits(attacks & enemy):
+                    append(frm | (to << 6) | (CAPTURE << 12))
+
+        # king
+        kings = bbs[base + KING] & from_mask
+        if kings:
+            frm = kings.bit_length() - 1
+            for to in iter_bits(KING_ATTACKS[frm] & empty):
+                append(frm | (to << 6))
+            for to in iter_bits(KING_ATTACKS[frm] & enemy):
+                append(frm | (to << 6) | (CAPTURE << 12))
+
+            # castling: path empty and king neither in, through nor into check
+            rights = self.castling & ((WHITE_KINGSIDE | WHITE_QUEENSIDE) if color == WHITE else (BLACK_KINGSIDE | BLACK_QUEENSIDE))
+            if rights:
+                for right, king_from, king_to, _, _, between, safe in CASTLING:
+                    if rights & right and frm == king_from and not occ & between:
+                        if not any(self.is_attacked(sq, color ^ 1, occ) for sq in safe):
+                            flags = KING_CASTLE if king_to > king_from else QUEEN_CASTLE
+                            append(frm | (king_to << 6) | (flags << 12))
+
+        return moves
+
+    def encode_move(self, frm, to, promo=0):
+        '''
+            Packed move with the flags this position implies for a from/to
+            pair (and promotion piece type, if any)
+        '''
+        ptype = self.mailbox[frm] % 6
+        flags = QUIET
+        if self.mailbox[to] is not None:
+            flags = CAPTURE
+        elif ptype == PAWN and (to - frm) % 8:
+            flags = EN_PASSANT
+        elif ptype == PAWN and abs(to - frm) == 16:
+            flags = DOUBLE_PUSH
+        elif ptype == KING and abs(to - frm) == 2:
+            flags = KING_CASTLE if to > frm else QUEEN_CASTLE
+        if promo:
+            flags |= promotion_flags(promo)
+        return frm | (to << 6) | (flags << 12)
+
+    def make_move(self, move):
+        '''
+            Play a move and return the undo record unmake_move needs to take it back
+        '''
+        frm = move & 63
+        to = (move >> 6) & 63
+        flags = move >> 12
+        code = self.mailbox[frm]
+        color, ptype = divmod(code, 6)
+        undo = (None, None, self.castling, self.ep, self.halfmove, self.hash)
+
+        # captured piece (en passant captures a pawn beside the target square)
+        if flags & CAPTURE:
+            captured_sq = to if flags != EN_PASSANT else to + (8 if color == WHITE else -8)
+            undo = (self.remove(captured_sq), captured_sq) + undo[2:]
+
+        # piece move
+        self.remove(frm)
+        self.put(color, (flags & 3) + 1 if flags & PROMOTION else ptype, to)
+
+        # castling rook
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_from, rook_to = CASTLING_ROOKS[to]
+            self.remove(rook_from)
+            self.put(color, ROOK, rook_to)
+
+        # state
+        key = self.hash ^ SIDE_KEY ^ CASTLING_KEYS[self.castling]
+        if self.ep is not None:
+            key ^= EP_KEYS[self.ep & 7]
+        self.castling &= ~(CASTLING_MASK[frm] | CASTLING_MASK[to])
+        key ^= CASTLING_KEYS[self.castling]
+
+        # en passant only when an enemy pawn can actually take, so that
+        # otherwise identical positions share a key
+        self.ep = None
+        if flags == DOUBLE_PUSH:
+            behind = (frm + to) // 2
+            if PAWN_ATTACKS[color][behind] & self.bitboards[(color ^ 1) * 6 + PAWN]:
+                self.ep = behind
+                key ^= EP_KEYS[behind & 7]
+        self.hash = key
+
+        self.halfmove = 0 if ptype == PAWN or flags & CAPTURE else self.halfmove + 1
+        if color == BLACK:
+            self.fullmove += 1
+        self.side = color ^ 1
+        return undo
+
+    def unmake_move(self, move, undo):
+        frm = move & 63
+        to = (move >> 6) & 63
+        flags = move >> 12
+        captured, captured_sq, self.castling, self.ep, self.halfmove, key = undo
+        color, ptype = divmod(self.remove(to), 6)
+
+        # piece back (a promoted piece goes back as a pawn)
+        self.put(color, PAWN if flags & PROMOTION else ptype, frm)
+
+        # castling rook back
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_from, rook_to = CASTLING_ROOKS[to]
+            self.remove(rook_to)
+            self.put(color, ROOK, rook_from)
+
+        # captured piece back
+        if captured is not None:
+            self.put(captured // 6, captured % 6, captured_sq)
+
+        if color == BLACK:
+            self.fullmove -= 1
+        self.side = color
+        self.hash = key
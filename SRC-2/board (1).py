@@ -1,68 +1,153 @@
 from const import *
 from square import Square
 from piece import *
-from move import Move
-from sound import Sound
-import copy
-import os
+from move import Move, move_to, promotion_type
+from bitboard import Position, COLORS, WHITE, QUEEN, CASTLING, PIECE_NAMES, square_index
+from evaluation import evaluate
+from pgn import san
 
 class Board:
 
-    def __init__(self):
+    def __init__(self, fen=None):
         self.squares = [[0, 0, 0, 0, 0, 0, 0, 0] for col in range(COLS)]
         self.last_move = None
         self._create()
-        self._add_pieces('white')
-        self._add_pieces('black')
+        if fen is None:
+            self._add_pieces('white')
+            self._add_pieces('black')
+            self.position = Position.from_board(self)
+        else:
+            self.position = Position.from_fen(fen)
+            self._add_fen_pieces()
+        self.legal_moves = {} # color -> packed legal moves of the current position
+        self.legal_keys = {} # color -> their from/to keys, for valid_move
+
+    @classmethod
+    def from_fen(cls, fen):
+        '''
+            Board for a FEN position, raises ValueError on a malformed FEN
+        '''
+        return cls(fen)
+
+    def fen(self):
+        return self.position.fen()
+
+    def move(self, piece, move, promotion=QUEEN):
+        '''
+            Play a move, returning whether it captured (en passant
+            included) so the caller can pick the sound
+        '''
+        undo = self.make_move(piece, move, promotion)
 
-    def move(self, piece, move, testing=False):
+        # clear valid moves
+        piece.clear_moves()
+        return undo.captured is not None
+
+    def make_move(self, piece, move, promotion=QUEEN):
+        '''
+            Play a move on the squares and the bitboard position, returning
+            the Undo record that unmake_move uses to restore the board.
+            Pawns reaching the last row promote to the promotion piece type
+        '''
         initial = move.initial
         final = move.final
-
-        en_passant_empty = self.squares[final.row][final.col].isempty()
+        undo = Undo(piece, move, piece.moved, self.last_move)
+        self.legal_moves.clear()
+        self.legal_keys.clear()
+
+        # captured piece (en passant captures the pawn beside the final square)
+        captured = self.squares[final.row][final.col].piece
+        if captured is not None:
+            undo.captured = captured
+            undo.captured_square = (final.row, final.col)
+        elif isinstance(piece, Pawn) and final.col != initial.col:
+            undo.captured = self.squares[initial.row][final.col].piece
+            undo.captured_square = (initial.row, final.col)
+            self.squares[initial.row][final.col].piece = None
+
+        # bitboard position update
+        undo.code = self.code(piece, move, promotion)
+        promo = promotion_type(undo.code)
+        undo.position = self.position.make_move(undo.code)
 
         # console board move update
         self.squares[initial.row][initial.col].piece = None
         self.squares[final.row][final.col].piece = piece
 
-        if isinstance(piece, Pawn):
-            # en passant capture
-            diff = final.col - initial.col
-            if diff != 0 and en_passant_empty:
-                # console board move update
-                self.squares[initial.row][initial.col + diff].piece = None
-                self.squares[final.row][final.col].piece = piece
-                if not testing:
-                    sound = Sound(
-                        os.path.join('assets/sounds/capture.wav'))
-                    sound.play()
-            
-            # pawn promotion
-            else:
-                self.check_promotion(piece, final)
+        # pawn promotion
+        if promo:
+            self.check_promotion(piece, final, promo)
+            undo.promoted = True
 
         # king castling
-        if isinstance(piece, King):
-            if self.castling(initial, final) and not testing:
-                diff = final.col - initial.col
-                rook = piece.left_rook if (diff < 0) else piece.right_rook
-                self.move(rook, rook.moves[-1])
+        if isinstance(piece, King) and self.castling(initial, final):
+            diff = final.col - initial.col
+            rook_col, rook_final_col = (0, 3) if (diff < 0) else (7, 5)
+            rook = self.squares[initial.row][rook_col].piece
+            undo.rook = (rook, rook_col, rook_final_col, rook.moved)
+            self.squares[initial.row][rook_col].piece = None
+            self.squares[initial.row][rook_final_col].piece = rook
+            rook.moved = True
 
         # move
         piece.moved = True
 
-        # clear valid moves
-        piece.clear_moves()
-
         # set last move
         self.last_move = move
 
-    def valid_move(self, piece, move):
-        return move in piece.moves
+        return undo
+
+    def unmake_move(self, undo):
+        initial = undo.move.initial
+        final = undo.move.final
+
+        # bitboard position restore
+        self.position.unmake_move(undo.code, undo.position)
+        self.legal_moves.clear()
+        self.legal_keys.clear()
+
+        # castling rook back
+        if undo.rook is not None:
+            rook, rook_col, rook_final_col, rook_moved = undo.rook
+            self.squares[initial.row][rook_final_col].piece = None
+            self.squares[initial.row][rook_col].piece = rook
+            rook.moved = rook_moved
+
+        # moved (or promoted) piece back
+        self.squares[final.row][final.col].piece = None
+        self.squares[initial.row][initial.col].piece = undo.piece
+        undo.piece.moved = undo.moved
+
+        # captured piece back
+        if undo.captured is not None:
+            row, col = undo.captured_square
+            self.squares[row][col].piece = undo.captured
 
-    def check_promotion(self, piece, final):
+        self.last_move = undo.last_move
+
+    def evaluate(self):
+        # centipawns from white's point of view, an O(1) read of the
+        # scores the position keeps up to date
+        score = evaluate(self.position)
+        return score if self.position.side == WHITE else -score
+
+    def valid_move(self, piece, move):
+        if self.squares[move.initial.row][move.initial.col].piece is not piece:
+            return False
+        self.legal_codes(COLORS[piece.color])
+        return move.key() in self.legal_keys[COLORS[piece.color]]
+
+    def legal_codes(self, color):
+        # legal moves are computed once per position and color
+        if color not in self.legal_moves:
+            codes = self.position.legal_moves(color)
+            self.legal_moves[color] = codes
+            self.legal_keys[color] = {code & 4095 for code in codes}
+        return self.legal_moves[color]
+
+    def check_promotion(self, piece, final, promotion=QUEEN):
         if final.row == 0 or final.row == 7:
-            self.squares[final.row][final.col].piece = Queen(piece.color)
+            self.squares[final.row][final.col].piece = PIECE_CLASSES[PIECE_NAMES[promotion]](piece.color)
 
     def castling(self, initial, final):
         return abs(initial.col - final.col) == 2
@@ -79,351 +164,66 @@ class Board:
         
         piece.en_passant = True
 
+    def code(self, piece, move, promotion=QUEEN):
+        # packed move for a board move, promoting pawns to promotion
+        initial, final = move.initial, move.final
+        promo = promotion if isinstance(piece, Pawn) and final.row in (0, 7) else 0
+        return self.position.encode_move(
+            square_index(initial.row, initial.col), square_index(final.row, final.col), promo)
+
+    def san(self, piece, move, promotion=QUEEN):
+        '''
+            Standard algebraic notation of a move about to be played
+        '''
+        return san(self.position, self.code(piece, move, promotion), self.legal_codes(COLORS[piece.color]))
+
+    def see(self, piece, move):
+        '''
+            Static exchange evaluation of a move in centipawns: what the
+            capture sequence on the final square wins (negative: loses)
+        '''
+        return self.position.see(self.code(piece, move))
+
     def in_check(self, piece, move):
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
-        temp_board.move(temp_piece, move, testing=True)
-        
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col, bool=False)
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            return True
-        
-        return False
+        undo = self.make_move(piece, move)
+        check = self.position.in_check(COLORS[piece.color])
+        self.unmake_move(undo)
+        return check
 
     def calc_moves(self, piece, row, col, bool=True):
         '''
             Calculate all the possible (valid) moves of an specific piece on a specific position
         '''
-        
-        def pawn_moves():
-            # steps
-            steps = 1 if piece.moved else 2
-
-            # vertical moves
-            start = row + piece.dir
-            end = row + (piece.dir * (1 + steps))
-            for possible_move_row in range(start, end, piece.dir):
-                if Square.in_range(possible_move_row):
-                    if self.squares[possible_move_row][col].isempty():
-                        # create initial and final move squares
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, col)
-                        # create a new move
-                        move = Move(initial, final)
-
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-                    # blocked
-                    else: break
-                # not in range
-                else: break
-
-            # diagonal moves
-            possible_move_row = row + piece.dir
-            possible_move_cols = [col-1, col+1]
-            for possible_move_col in possible_move_cols:
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                        # create initial and final move squares
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a new move
-                        move = Move(initial, final)
-                        
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-            # en passant moves
-            r = 3 if piece.color == 'white' else 4
-            fr = 2 if piece.color == 'white' else 5
-            # left en pessant
-            if Square.in_range(col-1) and row == r:
-                if self.squares[row][col-1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col-1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col-1, p)
-                            # create a new move
-                            move = Move(initial, final)
-                            
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-            
-            # right en pessant
-            if Square.in_range(col+1) and row == r:
-                if self.squares[row][col+1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col+1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares
-                            initial = Square(row, col)
-                            final = Square(fr, col+1, p)
-                            # create a new move
-                            move = Move(initial, final)
-                            
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-
-
-        def knight_moves():
-            # 8 possible moves
-            possible_moves = [
-                (row-2, col+1),
-                (row-1, col+2),
-                (row+1, col+2),
-                (row+2, col+1),
-                (row+2, col-1),
-                (row+1, col-2),
-                (row-1, col-2),
-                (row-2, col-1),
-            ]
-
-            for possible_move in possible_moves:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
-                        # create squares of the new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create new move
-                        move = Move(initial, final)
-                        
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                            else: break
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-        def straightline_moves(incrs):
-            for incr in incrs:
-                row_incr, col_incr = incr
-                possible_move_row = row + row_incr
-                possible_move_col = col + col_incr
-
-                while True:
-                    if Square.in_range(possible_move_row, possible_move_col):
-                        # create squares of the possible new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a possible new move
-                        move = Move(initial, final)
-
-                        # empty = continue looping
-                        if self.squares[possible_move_row][possible_move_col].isempty():
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-
-                        # has enemy piece = add move + break
-                        elif self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                            # check potencial checks
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else:
-                                # append new move
-                                piece.add_move(move)
-                            break
-
-                        # has team piece = break
-                        elif self.squares[possible_move_row][possible_move_col].has_team_piece(piece.color):
-                            break
-                    
-                    # not in range
-                    else: break
-
-                    # incrementing incrs
-                    possible_move_row = possible_move_row + row_incr
-                    possible_move_col = possible_move_col + col_incr
-
-        def king_moves():
-            adjs = [
-                (row-1, col+0), # up
-                (row-1, col+1), # up-right
-                (row+0, col+1), # right
-                (row+1, col+1), # down-right
-                (row+1, col+0), # down
-                (row+1, col-1), # down-left
-                (row+0, col-1), # left
-                (row-1, col-1), # up-left
-            ]
-
-            # normal moves
-            for possible_move in adjs:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.in_range(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
-                        # create squares of the new move
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, possible_move_col) # piece=piece
-                        # create new move
-                        move = Move(initial, final)
-                        # check potencial checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                            else: break
-                        else:
-                            # append new move
-                            piece.add_move(move)
-
-            # castling moves
-            if not piece.moved:
-                # queen castling
-                left_rook = self.squares[row][0].piece
-                if isinstance(left_rook, Rook):
-                    if not left_rook.moved:
-                        for c in range(1, 4):
-                            # castling is not possible because there are pieces in between ?
-                            if self.squares[row][c].has_piece():
-                                break
-
-                            if c == 3:
-                                # adds left rook to king
-                                piece.left_rook = left_rook
-
-                                # rook move
-                                initial = Square(row, 0)
-                                final = Square(row, 3)
-                                moveR = Move(initial, final)
-
-                                # king move
-                                initial = Square(row, col)
-                                final = Square(row, 2)
-                                moveK = Move(initial, final)
-
-                                # check potencial checks
-                                if bool:
-                                    if not self.in_check(piece, moveK) and not self.in_check(left_rook, moveR):
-                                        # append new move to rook
-                                        left_rook.add_move(moveR)
-                                        # append new move to king
-                                        piece.add_move(moveK)
-                                else:
-                                    # append new move to rook
-                                    left_rook.add_move(moveR)
-                                    # append new move king
-                                    piece.add_move(moveK)
-
-                # king castling
-                right_rook = self.squares[row][7].piece
-                if isinstance(right_rook, Rook):
-                    if not right_rook.moved:
-                        for c in range(5, 7):
-                            # castling is not possible because there are pieces in between ?
-                            if self.squares[row][c].has_piece():
-                                break
-
-                            if c == 6:
-                                # adds right rook to king
-                                piece.right_rook = right_rook
-
-                                # rook move
-                                initial = Square(row, 7)
-                                final = Square(row, 5)
-                                moveR = Move(initial, final)
-
-                                # king move
-                                initial = Square(row, col)
-                                final = Square(row, 6)
-                                moveK = Move(initial, final)
-
-                                # check potencial checks
-                                if bool:
-                                    if not self.in_check(piece, moveK) and not self.in_check(right_rook, moveR):
-                                        # append new move to rook
-                                        right_rook.add_move(moveR)
-                                        # append new move to king
-                                        piece.add_move(moveK)
-                                else:
-                                    # append new move to rook
-                                    right_rook.add_move(moveR)
-                                    # append new move king
-                                    piece.add_move(moveK)
-
-        if isinstance(piece, Pawn): 
-            pawn_moves()
-
-        elif isinstance(piece, Knight): 
-            knight_moves()
-
-        elif isinstance(piece, Bishop): 
-            straightline_moves([
-                (-1, 1), # up-right
-                (-1, -1), # up-left
-                (1, 1), # down-right
-                (1, -1), # down-left
-            ])
-
-        elif isinstance(piece, Rook): 
-            straightline_moves([
-                (-1, 0), # up
-                (0, 1), # right
-                (1, 0), # down
-                (0, -1), # left
-            ])
-
-        elif isinstance(piece, Queen): 
-            straightline_moves([
-                (-1, 1), # up-right
-                (-1, -1), # up-left
-                (1, 1), # down-right
-                (1, -1), # down-left
-                (-1, 0), # up
-                (0, 1), # right
-                (1, 0), # down
-                (0, -1) # left
-            ])
-
-        elif isinstance(piece, King): 
-            king_moves()
+        piece.clear_moves()
+        frm = square_index(row, col)
+
+        if bool:
+            codes = [code for code in self.legal_codes(COLORS[piece.color]) if code & 63 == frm]
+        else:
+            codes = self.position.generate(COLORS[piece.color], 1 << frm)
+
+        for code in codes:
+            # the board always promotes to a queen
+            promo = promotion_type(code)
+            if promo and promo != QUEEN:
+                continue
+
+            to = move_to(code)
+            final_row, final_col = to >> 3, to & 7
+            final_piece = self.squares[final_row][final_col].piece
+
+            # en passant captures the pawn beside the target square
+            if final_piece is None and isinstance(piece, Pawn) and final_col != col:
+                final_piece = self.squares[row][final_col].piece
+
+            # create initial and final move squares
+            initial = Square(row, col)
+            final = Square(final_row, final_col, final_piece)
+            # create a new move
+            move = Move(initial, final)
+
+            # append new move
+            piece.add_move(move)
 
     def _create(self):
         for row in range(ROWS):
@@ -453,4 +253,49 @@ class Board:
         self.squares[row_other][3] = Square(row_other, 3, Queen(color))
 
         # king
-        self.squares[row_other][4] = Square(row_other, 4, King(color))
\ No newline at end of file
+        self.squares[row_other][4] = Square(row_other, 4, King(color))
+
+    def _add_fen_pieces(self):
+        position = self.position
+        for sq in range(64):
+            kind = position.piece_at(sq)
+            if kind is not None:
+                row, col = sq >> 3, sq & 7
+                piece = PIECE_CLASSES[kind.name](kind.color)
+                # pawns off their start row have moved
+                if isinstance(piece, Pawn):
+                    piece.moved = row != (6 if kind.color == 'white' else 1)
+                self.squares[row][col] = Square(row, col, piece)
+
+        # kings and rooks without a castling right count as moved
+        for sq in range(64):
+            piece = self.squares[sq >> 3][sq & 7].piece
+            if isinstance(piece, (King, Rook)):
+                piece.moved = True
+        for right, king_from, _, rook_from, _, _, _ in CASTLING:
+            king = self.squares[king_from >> 3][king_from & 7].piece
+            rook = self.squares[rook_from >> 3][rook_from & 7].piece
+            if position.castling & right and isinstance(king, King) and isinstance(rook, Rook):
+                king.moved = rook.moved = False
+
+        # the pawn that just made the double step en passant refers to
+        if position.ep is not None:
+            behind = position.ep + 8 if position.side == WHITE else position.ep - 8
+            self.squares[behind >> 3][behind & 7].piece.en_passant = True
+
+class Undo:
+    '''
+        Everything Board.unmake_move needs to take back a move
+    '''
+
+    def __init__(self, piece, move, moved, last_move):
+        self.piece = piece
+        self.move = move
+        self.moved = moved
+        self.last_move = last_move
+        self.code = None
+        self.position = None
+        self.captured = None
+        self.captured_square = None
+        self.promoted = False
+        self.rook = None
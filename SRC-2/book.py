@@ -0,0 +1,154 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+
+from const import *
+from bitboard import Position
+from move import KING_CASTLE, QUEEN_CASTLE, move_flags, promotion_type, to_uci
+
+# Polyglot record layout: big-endian key, move, weight and learn fields,
+# 16 bytes per record, sorted by key. The keys are this engine's Zobrist
+# keys, so books have to be built with build_book below
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+def polyglot_move(code):
+    '''
+        Polyglot move bits for a packed move: to file/rank, from file/rank
+        (rank 0 is the white side) and promotion piece; castling is written
+        as the king taking its own rook
+    '''
+    frm, to = code & 63, (code >> 6) & 63
+    flags = move_flags(code)
+    if flags == KING_CASTLE:
+        to += 1
+    elif flags == QUEEN_CASTLE:
+        to -= 2
+    return ((to & 7) | ((7 - (to >> 3)) << 3)
+            | ((frm & 7) << 6) | ((7 - (frm >> 3)) << 9)
+            | (promotion_type(code) << 12))
+
+class OpeningBook:
+    '''
+        Read-only opening book mapped into memory; lookups binary search
+        the mapped records, so processes opening the same file share one
+        copy through the page cache instead of each loading it
+    '''
+
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def entries(self, key):
+        '''
+            (polyglot move, weight) of every record stored for a key
+        '''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.map, mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        while lo < self.count:
+            entry_key, raw, weight, _ = ENTRY.unpack_from(self.map, lo * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((raw, weight))
+            lo += 1
+        return entries
+
+    def moves(self, position):
+        '''
+            (packed move, weight) of the legal book moves of a position
+        '''
+        if not self.count:
+            return []
+        legal = {polyglot_move(code): code for code in position.legal_moves()}
+        return [(legal[raw], weight) for raw, weight in self.entries(position.hash)
+                if raw in legal and weight > 0]
+
+    def choose(self, position, rng=random):
+        '''
+            Weighted random book move, or None when out of book
+        '''
+        moves = self.moves(position)
+        if not moves:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in moves))
+        for code, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return code
+
+def read_lines(path):
+    '''
+        Move lists (UCI strings) from a text file, one game or line per row;
+        blank lines and # comments are skipped
+    '''
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield line.split()
+
+def build_book(lines, path, max_ply=BOOK_MAX_PLY):
+    '''
+        Write a book from move lists; a move's weight is how often it was
+        played from that position. Returns the number of records written
+    '''
+    counts = {}
+    for line in lines:
+        position = Position.from_fen(START_FEN)
+        for uci in line[:max_ply]:
+            legal = {to_uci(code): code for code in position.legal_moves()}
+            if uci not in legal:
+                raise ValueError(f'illegal move {uci!r} in line {" ".join(line)!r}')
+            code = legal[uci]
+            entry = (position.hash, polyglot_move(code))
+            counts[entry] = counts.get(entry, 0) + 1
+            position.make_move(code)
+
+    records = sorted(counts.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(path, 'wb') as f:
+        for (key, raw), count in records:
+            f.write(ENTRY.pack(key, raw, min(count, 0xFFFF), 0))
+    return len(records)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or query the opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from UCI move lines')
+    build.add_argument('source', nargs='?', default='assests/openings.txt')
+    build.add_argument('--out', default=BOOK_PATH)
+    build.add_argument('--max-ply', type=int, default=BOOK_MAX_PLY)
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('--fen', default=START_FEN)
+    probe.add_argument('--book', default=BOOK_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_book(read_lines(args.source), args.out, args.max_ply)
+        print(f'wrote {count} entries to {args.out}')
+    else:
+        book = OpeningBook(args.book)
+        for code, weight in book.moves(Position.from_fen(args.fen)):
+            print(f'{to_uci(code)} {weight}')
+        book.close()
@@ -1,6 +1,7 @@
 import pygame
 import os
 
+from const import *
 from sound import Sound
 from theme import Theme
 
@@ -13,9 +14,9 @@ class Config:
         self.theme = self.themes[self.idx]
         self.font = pygame.font.SysFont('monospace', 18, bold=True)
         self.move_sound = Sound(
-            r"C:\Users\pakiy\Downloads\SRC-2-20240614T141709Z-001\assests\sounds\move.wav")
+            os.path.join(SOUND_DIR, 'move.wav'))
         self.capture_sound = Sound(
-            r"C:\Users\pakiy\Downloads\SRC-2-20240614T141709Z-001\assests\sounds\capture.wav")
+            os.path.join(SOUND_DIR, 'capture.wav'))
 
     def change_theme(self):
         self.idx += 1
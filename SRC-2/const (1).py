@@ -5,4 +5,34 @@ HEIGHT = 800
 # Board dimensions
 ROWS = 8
 COLS = 8
-SQSIZE = WIDTH // COLS
\ No newline at end of file
+SQSIZE = WIDTH // COLS
+
+# Highlights
+HOVER_COLOR = (180, 180, 180)
+CHECK_COLOR = (200, 40, 40)
+
+# Sounds, move.wav and capture.wav
+SOUND_DIR = 'assests/sounds'
+
+# Rendered text surfaces kept for reuse
+TEXT_CACHE_ENTRIES = 256
+
+# Engine
+TT_SIZE_MB = 16
+AI_MAX_DEPTH = 64
+AI_TIME_LIMIT = 2.0 # seconds per move
+AI_WORKERS = 1 # search processes; see parallel_search.py for a speedup benchmark
+BOOK_PATH = 'assests/book.bin' # built from assests/openings.txt with book.py
+BOOK_MAX_PLY = 20
+TABLE_DIR = 'assests/tables' # endgame tables, generated with endgame.py
+AI_PONDER = True # search the expected reply during the player's turn
+PGN_PATH = 'games.pgn' # finished games are appended here
+PAWN_TABLE_ENTRIES = 1 << 14 # pawn structure cache used by the evaluation
+
+# Frame timing: on from the start, samples kept per stage, seconds between
+# overlay refreshes, and where to dump the samples on exit (.csv or .json,
+# None for nowhere)
+PROFILE = False
+PROFILE_SAMPLES = 600
+OVERLAY_REFRESH = 0.25
+PROFILE_DUMP = None
@@ -1,6 +1,5 @@
-import pygame
-
 from const import *
+from textures import SPRITES
 
 class Dragger:
 
@@ -15,16 +14,19 @@ class Dragger:
     # blit method
 
     def update_blit(self, surface):
-        # texture
-        self.piece.set_texture(size=128)
-        texture = self.piece.texture
         # img
-        img = pygame.image.load(texture)
+        img = SPRITES.get(self.piece, size=128)
         # rect
-        img_center = (self.mouseX, self.mouseY)
-        self.piece.texture_rect = img.get_rect(center=img_center)
+        texture_rect = self.rect()
         # blit
-        surface.blit(img, self.piece.texture_rect)
+        surface.blit(img, texture_rect)
+        return texture_rect
+
+    def rect(self):
+        # area covered by the dragged piece at the mouse
+        img = SPRITES.get(self.piece, size=128)
+        img_center = (self.mouseX, self.mouseY)
+        return img.get_rect(center=img_center)
 
     # other methods
 
@@ -0,0 +1,265 @@
+import argparse
+import os
+import time
+
+from const import *
+from bitboard import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KING_ATTACKS, PAWN_ATTACKS,
+                      rook_attacks, queen_attacks, popcount, lsb)
+
+# Distance-to-mate tables for king + one piece against a lone king.
+# Positions are stored from the strong side's point of view (the strong
+# side plays "white", so black-strong positions are probed mirrored) at
+# index ((side to move * 64 + strong king) * 64 + weak king) * 64 + piece,
+# where side to move is 0 for the strong side and 1 for the weak side.
+# One byte per position: 0 draw, 255 illegal, otherwise mate in value - 1
+# plies for the strong side.
+DRAW = 0
+ILLEGAL = 255
+SIZE = 1 << 19
+
+TABLES = {'KQK': QUEEN, 'KRK': ROOK, 'KPK': PAWN}
+
+def index(stm, strong_king, weak_king, piece):
+    return (stm << 18) | (strong_king << 12) | (weak_king << 6) | piece
+
+def _piece_attacks(ptype, sq, occ):
+    if ptype == QUEEN:
+        return queen_attacks(sq, occ)
+    if ptype == ROOK:
+        return rook_attacks(sq, occ)
+    return PAWN_ATTACKS[WHITE][sq]
+
+def generate(ptype, promotions=None):
+    '''
+        Build the table of one material set by retrograde analysis: start
+        from the mates and walk backwards ply by ply. For KPK, promotions
+        are looked up in the KQK and KRK tables passed as promotions
+        ({piece type: table}). Returns the table as bytes
+    '''
+    values = bytearray(SIZE)
+    counters = bytearray(SIZE) # weak side moves not yet known to lose
+    layer = []
+    seeds = {}
+
+    # legality, move counts of the weak side and the mates
+    for sk in range(64):
+        for wk in range(64):
+            if wk == sk or (KING_ATTACKS[sk] >> wk) & 1:
+                for p in range(64):
+                    values[index(0, sk, wk, p)] = ILLEGAL
+                    values[index(1, sk, wk, p)] = ILLEGAL
+                continue
+            guarded = KING_ATTACKS[sk]
+            for p in range(64):
+                if p == sk or p == wk or (ptype == PAWN and (p >> 3) in (0, 7)):
+                    values[index(0, sk, wk, p)] = ILLEGAL
+                    values[index(1, sk, wk, p)] = ILLEGAL
+                    continue
+
+                # the weak king may not stand in check with the strong side to move
+                attacks = _piece_attacks(ptype, p, (1 << sk) | (1 << wk))
+                check = (attacks >> wk) & 1
+                if check:
+                    values[index(0, sk, wk, p)] = ILLEGAL
+
+                # weak king moves; sliders see through the square it leaves
+                attacks = _piece_attacks(ptype, p, 1 << sk)
+                moves = 0
+                targets = KING_ATTACKS[wk] & ~guarded
+                while targets:
+                    b = targets & -targets
+                    to = b.bit_length() - 1
+                    targets ^= b
+                    if to == p or not (attacks >> to) & 1:
+                        moves += 1
+                idx = index(1, sk, wk, p)
+                counters[idx] = moves
+                if not moves and check:
+                    values[idx] = 1
+                    layer.append(idx)
+
+    # strong-side wins by promotion, seeded at their distance
+    if ptype == PAWN:
+        for sk in range(64):
+            for wk in range(64):
+                for p in range(8, 16):
+                    idx = index(0, sk, wk, p)
+                    if values[idx] == ILLEGAL or p - 8 in (sk, wk):
+                        continue
+                    best = None
+                    for table in promotions.values():
+                        value = table[index(1, sk, wk, p - 8)]
+                        if value not in (DRAW, ILLEGAL) and (best is None or value < best):
+                            best = value
+                    if best is not None:
+                        seeds.setdefault(best, []).append(idx)
+
+    # backwards, one ply at a time
+    dtm = 0
+    while layer or any(d >= dtm for d in seeds):
+        # promotion wins count unless a shorter mate was found already
+        for idx in seeds.pop(dtm, []):
+            if values[idx] == 0:
+                values[idx] = dtm + 1
+                layer.append(idx)
+        next_layer = []
+        for idx in layer:
+            stm, sk, wk, p = idx >> 18, (idx >> 12) & 63, (idx >> 6) & 63, idx & 63
+            if stm == 0:
+                # weak side positions one move earlier lose once all their moves do
+                targets = KING_ATTACKS[wk] & ~KING_ATTACKS[sk] & ~(1 << p)
+                while targets:
+                    b = targets & -targets
+                    w2 = b.bit_length() - 1
+                    targets ^= b
+                    prev = index(1, sk, w2, p)
+                    if values[prev] == 0 and counters[prev]:
+                        counters[prev] -= 1
+                        if not counters[prev]:
+                            values[prev] = dtm + 2
+                            next_layer.append(prev)
+            else:
+                # strong side positions one move earlier win by moving here
+                for prev in _strong_predecessors(ptype, sk, wk, p):
+                    if values[prev] == 0:
+                        values[prev] = dtm + 2
+                        next_layer.append(prev)
+        layer = next_layer
+        dtm += 1
+
+    return bytes(values)
+
+def _strong_predecessors(ptype, sk, wk, p):
+    occ = (1 << sk) | (1 << wk) | (1 << p)
+    # king steps back
+    targets = KING_ATTACKS[sk] & ~KING_ATTACKS[wk] & ~occ
+    while targets:
+        b = targets & -targets
+        targets ^= b
+        yield index(0, b.bit_length() - 1, wk, p)
+    # piece steps back
+    if ptype == PAWN:
+        # white pawns move towards row 0, so they came from a higher row
+        if (p >> 3) < 6 and not (occ >> (p + 8)) & 1:
+            yield index(0, sk, wk, p + 8)
+            if (p >> 3) == 4 and not (occ >> (p + 16)) & 1:
+                yield index(0, sk, wk, p + 16)
+    else:
+        targets = _piece_attacks(ptype, p, occ) & ~occ
+        while targets:
+            b = targets & -targets
+            targets ^= b
+            yield index(0, sk, wk, b.bit_length() - 1)
+
+def generate_all(directory=TABLE_DIR, names=('KQK', 'KRK', 'KPK')):
+    os.makedirs(directory, exist_ok=True)
+    built = {}
+    for name in ('KQK', 'KRK', 'KPK'):
+        if name not in names and not (name != 'KPK' and 'KPK' in names):
+            continue
+        path = os.path.join(directory, name + '.bin')
+        start = time.perf_counter()
+        if name == 'KPK':
+            table = generate(PAWN, {QUEEN: built['KQK'], ROOK: built['KRK']})
+        else:
+            table = generate(TABLES[name])
+        built[name] = table
+        if name in names:
+            with open(path, 'wb') as f:
+                f.write(table)
+            longest = max(value for value in table if value != ILLEGAL) - 1
+            print(f'{name}: {time.perf_counter() - start:.1f}s, longest mate {longest} plies -> {path}')
+    return built
+
+class EndgameTables:
+    '''
+        Lazily loaded KQK/KRK/KPK tables; probe and best_move answer in
+        constant time per position when the material matches
+    '''
+
+    def __init__(self, directory=TABLE_DIR):
+        self.directory = directory
+        self.tables = {}
+
+    def _table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + '.bin')
+            table = None
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    table = f.read()
+                if len(table) != SIZE:
+                    table = None
+            self.tables[name] = table
+        return self.tables[name]
+
+    def probe(self, position):
+        '''
+            (result, plies to mate) for the side to move, result 1 win,
+            0 draw, -1 loss; None when the material is not covered
+        '''
+        occ = position.occupancy[WHITE] | position.occupancy[BLACK]
+        count = popcount(occ)
+        if count == 2:
+            return (0, 0)
+        if count != 3:
+            return None
+
+        bbs = position.bitboards
+        # a lone minor piece cannot mate (underpromotions end up here)
+        for color in (WHITE, BLACK):
+            if bbs[color * 6 + KNIGHT] or bbs[color * 6 + BISHOP]:
+                return (0, 0)
+        for strong in (WHITE, BLACK):
+            for name, ptype in TABLES.items():
+                if bbs[strong * 6 + ptype]:
+                    break
+            else:
+                continue
+            break
+        else:
+            return None
+
+        table = self._table(name)
+        if table is None:
+            return None
+
+        sk = lsb(bbs[strong * 6 + KING])
+        wk = lsb(bbs[(strong ^ 1) * 6 + KING])
+        p = lsb(bbs[strong * 6 + ptype])
+        if strong == BLACK:
+            # mirror the board so the strong side plays up the board
+            sk, wk, p = sk ^ 56, wk ^ 56, p ^ 56
+        stm = 0 if position.side == strong else 1
+        value = table[index(stm, sk, wk, p)]
+        if value in (DRAW, ILLEGAL):
+            return (0, 0)
+        return (1, value - 1) if stm == 0 else (-1, value - 1)
+
+    def best_move(self, position):
+        '''
+            Fastest mate when winning, longest resistance when losing and a
+            drawing move otherwise; None when the material is not covered
+        '''
+        if self.probe(position) is None:
+            return None
+        best, best_key = None, None
+        for move in position.legal_moves():
+            undo = position.make_move(move)
+            result = self.probe(position)
+            position.unmake_move(move, undo)
+            if result is None:
+                continue
+            # the result is the opponent's: their loss is our win
+            outcome, plies = result
+            key = (0, plies) if outcome < 0 else (1, 0) if outcome == 0 else (2, -plies)
+            if best_key is None or key < best_key:
+                best, best_key = move, key
+        return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate endgame distance-to-mate tables')
+    parser.add_argument('names', nargs='*', default=['KQK', 'KRK', 'KPK'])
+    parser.add_argument('--dir', default=TABLE_DIR)
+    args = parser.parse_args()
+    generate_all(args.dir, args.names)
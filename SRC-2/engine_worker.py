@@ -0,0 +1,114 @@
+import threading
+import pygame
+
+from const import *
+from profiler import TIMERS
+
+# posted when a background search finishes: code is the packed move (or
+# None without legal moves), search_id tells stale results apart
+AI_MOVE = pygame.USEREVENT + 1
+
+class EngineWorker:
+    '''
+        Runs AI searches on a background thread so the pygame loop keeps
+        pumping events and redrawing; the result comes back as an AI_MOVE event.
+        While the player is to move it can ponder: search the position after
+        the expected reply and, if the player makes that move, keep going
+        instead of starting cold
+    '''
+
+    def __init__(self, ai, ponder=AI_PONDER):
+        self.ai = ai
+        self.ponder_enabled = ponder
+        self.thread = None
+        self.timer = None
+        self.search_id = 0
+        self.lock = threading.Lock()
+        self.pondering = False
+        self.ponder_key = None # hash of the position being pondered
+        self.ponder_result = None # (code,) once a ponder search has finished
+
+    def is_thinking(self):
+        return self.thread is not None and self.thread.is_alive() and not self.pondering
+
+    def start(self, board):
+        # a ponder hit: the player made the expected move
+        if self.pondering and board.position.hash == self.ponder_key:
+            self._ponder_hit()
+            return
+        self.cancel()
+        # the search works on its own snapshot of the position
+        self._spawn(board.position.copy(), False)
+
+    def ponder(self, board, code):
+        '''
+            Start pondering after the AI played code on the board
+        '''
+        self.cancel()
+        if not self.ponder_enabled:
+            return
+        position = board.position.copy()
+        reply = self.ai.predict(position, code)
+        if reply is None:
+            return
+        position.make_move(reply)
+        with self.lock:
+            self.pondering = True
+            self.ponder_key = position.hash
+            self.ponder_result = None
+        self._spawn(position, True)
+
+    def cancel(self):
+        # results of the running search are ignored from now on
+        with self.lock:
+            self.search_id += 1
+            self.pondering = False
+            self.ponder_result = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.thread is not None:
+            # keep asking until the search notices (it may not have started yet)
+            while self.thread.is_alive():
+                self.ai.engine.stop()
+                self.thread.join(0.01)
+            self.thread = None
+
+    def _spawn(self, position, ponder):
+        self.search_id += 1
+        self.thread = threading.Thread(
+            target=self._run, args=(position, self.search_id, ponder), daemon=True)
+        self.thread.start()
+
+    def _ponder_hit(self):
+        with self.lock:
+            self.pondering = False
+            result = self.ponder_result
+            search_id = self.search_id
+        if result is not None:
+            # the ponder search already finished (mate found, book or tables)
+            self._post(result[0], search_id)
+        elif self.ai.time_limit is not None:
+            # from now on the search gets the normal time for a move
+            self.timer = threading.Timer(self.ai.time_limit, self._stop, args=(search_id,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _stop(self, search_id):
+        if search_id == self.search_id:
+            self.ai.engine.stop()
+
+    def _post(self, code, search_id):
+        pygame.event.post(pygame.event.Event(AI_MOVE, code=code, search_id=search_id))
+
+    def _run(self, position, search_id, ponder):
+        with TIMERS.stage('ponder' if ponder else 'ai'):
+            code = self.ai.search(position, ponder)
+        with self.lock:
+            if search_id != self.search_id:
+                return
+            # still waiting for the player: keep the move for a ponder hit
+            if self.pondering:
+                self.ponder_result = (code,)
+                return
+        self._post(code, search_id)
@@ -0,0 +1,252 @@
+from const import *
+from piece import PIECE_KINDS
+
+# Position imports these tables to keep its scores incrementally, so this
+# module only uses the piece codes (color * 6 + piece type) it shares with
+# the bitboard core: white 0, black 1; pawn 0 .. king 5
+
+# material in centipawns, taken from Piece.value (the king is never traded)
+MATERIAL = [round(kind.value * 100) for kind in PIECE_KINDS[:5]] + [0]
+
+# game phase weight per piece type: 24 with all minor and major pieces on
+# the board, 0 with only kings and pawns
+PHASE = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+# middlegame piece-square tables from white's point of view, a8 first (the same
+# row * 8 + col order as Board.squares); black reads them mirrored
+PST = [
+    # pawn
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+      50,  50,  50,  50,  50,  50,  50,  50,
+      10,  10,  20,  30,  30,  20,  10,  10,
+       5,   5,  10,  25,  25,  10,   5,   5,
+       0,   0,   0,  20,  20,   0,   0,   0,
+       5,  -5, -10,   0,   0, -10,  -5,   5,
+       5,  10,  10, -20, -20,  10,  10,   5,
+       0,   0,   0,   0,   0,   0,   0,   0],
+    # knight
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20,   0,   0,   0,   0, -20, -40,
+     -30,   0,  10,  15,  15,  10,   0, -30,
+     -30,   5,  15,  20,  20,  15,   5, -30,
+     -30,   0,  15,  20,  20,  15,   0, -30,
+     -30,   5,  10,  15,  15,  10,   5, -30,
+     -40, -20,   0,   5,   5,   0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    # bishop
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,  10,  10,   5,   0, -10,
+     -10,   5,   5,  10,  10,   5,   5, -10,
+     -10,   0,  10,  10,  10,  10,   0, -10,
+     -10,  10,  10,  10,  10,  10,  10, -10,
+     -10,   5,   0,   0,   0,   0,   5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    # rook
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+       5,  10,  10,  10,  10,  10,  10,   5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+       0,   0,   0,   5,   5,   0,   0,   0],
+    # queen
+    [-20, -10, -10,  -5,  -5, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,   5,   5,   5,   0, -10,
+      -5,   0,   5,   5,   5,   5,   0,  -5,
+       0,   0,   5,   5,   5,   5,   0,  -5,
+     -10,   5,   5,   5,   5,   5,   0, -10,
+     -10,   0,   5,   0,   0,   0,   0, -10,
+     -20, -10, -10,  -5,  -5, -10, -10, -20],
+    # king
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+      20,  20,   0,   0,   0,   0,  20,  20,
+      20,  30,  10,   0,   0,  10,  30,  20],
+]
+
+# endgame tables where they differ: pawns gain as they advance, the king
+# heads for the center
+PST_EG = [list(table) for table in PST]
+PST_EG[0] = [
+       0,   0,   0,   0,   0,   0,   0,   0,
+      80,  80,  80,  80,  80,  80,  80,  80,
+      50,  50,  50,  50,  50,  50,  50,  50,
+      30,  30,  30,  30,  30,  30,  30,  30,
+      20,  20,  20,  20,  20,  20,  20,  20,
+      10,  10,  10,  10,  10,  10,  10,  10,
+       5,   5,   5,   5,   5,   5,   5,   5,
+       0,   0,   0,   0,   0,   0,   0,   0]
+PST_EG[5] = [
+     -50, -40, -30, -20, -20, -30, -40, -50,
+     -30, -20, -10,   0,   0, -10, -20, -30,
+     -30, -10,  20,  30,  30,  20, -10, -30,
+     -30, -10,  30,  40,  40,  30, -10, -30,
+     -30, -10,  30,  40,  40,  30, -10, -30,
+     -30, -10,  20,  30,  30,  20, -10, -30,
+     -30, -30,   0,   0,   0,   0, -30, -30,
+     -50, -30, -30, -30, -30, -30, -30, -50]
+
+def _piece_square(tables):
+    # material plus table score of each piece code on each square, white positive
+    scores = [[0] * 64 for code in range(12)]
+    for ptype in range(6):
+        for sq in range(64):
+            scores[ptype][sq] = MATERIAL[ptype] + tables[ptype][sq]
+            scores[6 + ptype][sq] = -(MATERIAL[ptype] + tables[ptype][sq ^ 56])
+    return scores
+
+PIECE_SQUARE_MG = _piece_square(PST)
+PIECE_SQUARE_EG = _piece_square(PST_EG)
+
+# pawn structure terms (middlegame, endgame) in centipawns
+DOUBLED = (-10, -20) # per extra pawn on a file
+ISOLATED = (-10, -15) # per pawn without friendly pawns on the adjacent files
+# passed pawn bonus by rank from the pawn's own side, 1 is its start rank
+PASSED_MG = [0, 5, 10, 15, 25, 40, 60, 0]
+PASSED_EG = [0, 10, 20, 35, 60, 100, 150, 0]
+
+def _file_masks():
+    files = [0] * 8
+    for sq in range(64):
+        files[sq & 7] |= 1 << sq
+    adjacent = [(files[col - 1] if col > 0 else 0) | (files[col + 1] if col < 7 else 0) for col in range(8)]
+    return files, adjacent
+
+FILES, ADJACENT_FILES = _file_masks()
+
+def _passed_masks():
+    # squares ahead of a pawn on its own and the adjacent files; white
+    # pawns move towards row 0
+    masks = [[0] * 64, [0] * 64]
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        span = FILES[col] | ADJACENT_FILES[col]
+        for other in range(64):
+            if span >> other & 1:
+                if other >> 3 < row:
+                    masks[0][sq] |= 1 << other
+                elif other >> 3 > row:
+                    masks[1][sq] |= 1 << other
+    return masks
+
+PASSED_MASKS = _passed_masks()
+
+def pawn_structure(position):
+    '''
+        Doubled, isolated and passed pawn terms as (mg, eg), white positive;
+        depends on the pawns alone, so PawnTable caches it by pawn hash
+    '''
+    mg = eg = 0
+    pawns = (position.bitboards[0], position.bitboards[6])
+    for color in (0, 1):
+        own, enemy = pawns[color], pawns[color ^ 1]
+        sign = 1 if color == 0 else -1
+        for col in range(8):
+            count = bin(own & FILES[col]).count('1')
+            if count > 1:
+                mg += sign * DOUBLED[0] * (count - 1)
+                eg += sign * DOUBLED[1] * (count - 1)
+            if count and not own & ADJACENT_FILES[col]:
+                mg += sign * ISOLATED[0] * count
+                eg += sign * ISOLATED[1] * count
+        bb = own
+        while bb:
+            bit = bb & -bb
+            sq = bit.bit_length() - 1
+            bb ^= bit
+            # only the front pawn of a file can be passed
+            ahead = PASSED_MASKS[color][sq]
+            if not enemy & ahead and not own & ahead & FILES[sq & 7]:
+                rank = 7 - (sq >> 3) if color == 0 else sq >> 3
+                mg += sign * PASSED_MG[rank]
+                eg += sign * PASSED_EG[rank]
+    return mg, eg
+
+class PawnTable:
+    '''
+        Small cache of pawn_structure keyed by the position's pawn hash;
+        pawns move rarely, so most evaluations find their entry here
+    '''
+
+    def __init__(self, entries=PAWN_TABLE_ENTRIES):
+        # a power of two so the index is a mask of the key
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.scores = [None] * size
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        for i in range(len(self.keys)):
+            self.keys[i] = None
+            self.scores[i] = None
+        self.probes = 0
+        self.hits = 0
+
+    def score(self, position):
+        key = position.pawn_hash
+        index = key & self.mask
+        self.probes += 1
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        scores = pawn_structure(position)
+        self.keys[index] = key
+        self.scores[index] = scores
+        return scores
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+# shared by every search of a process; searches run one at a time
+PAWN_TABLE = PawnTable()
+
+def evaluate(position, pawn_table=PAWN_TABLE):
+    '''
+        Static evaluation in centipawns from the side to move's point of
+        view, blending the middlegame and endgame scores Position keeps up
+        to date, plus the cached pawn structure, by game phase
+    '''
+    pawn_mg, pawn_eg = pawn_table.score(position)
+    phase = position.phase if position.phase < MAX_PHASE else MAX_PHASE
+    score = ((position.mg + pawn_mg) * phase + (position.eg + pawn_eg) * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if position.side == 0 else -score
+
+def evaluate_material(position):
+    '''
+        Material balance only, a baseline for measuring what the tables add
+    '''
+    score = position.material[0] - position.material[1]
+    return score if position.side == 0 else -score
+
+def evaluate_full(position):
+    '''
+        Same as evaluate but recomputed from the mailbox, for checking the
+        incremental scores
+    '''
+    mg = eg = phase = 0
+    for sq, code in enumerate(position.mailbox):
+        if code is not None:
+            mg += PIECE_SQUARE_MG[code][sq]
+            eg += PIECE_SQUARE_EG[code][sq]
+            phase += PHASE[code % 6]
+    pawn_mg, pawn_eg = pawn_structure(position)
+    mg += pawn_mg
+    eg += pawn_eg
+    phase = min(phase, MAX_PHASE)
+    score = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if position.side == 0 else -score
+
+# evaluation variants selectable by name, e.g. AI(evaluation='material')
+EVALUATIONS = {'default': evaluate, 'material': evaluate_material}
@@ -8,24 +8,39 @@ from config import Config
 from square import Square
 from move import Move
 from popup import Popup
+from textures import SPRITES, TEXTS
+from renderer import Renderer
+from pgn import PGNWriter, game_result
 
-# Load SpaCy English model
-nlp = spacy.load("en_core_web_sm")
+# SpaCy English model, loaded the first time a command is interpreted
+nlp = None
 
 class Game:
-    def __init__(self):
+    def __init__(self, microphone=True):
         self.next_player = 'white'
         self.hovered_sqr = None
+        self.game_over = False
+        self.result = '*' # PGN result, updated by next_turn
         self.board = Board()
         self.dragger = Dragger()
         self.config = Config()
         self.popup = Popup(WIDTH, HEIGHT)
+        # pre-rendered background, see background()
+        self.bg_surface = None
+        self.bg_key = None
+        # game record, appended to PGN_PATH when the game ends
+        self.pgn = PGNWriter()
+        self.pgn.start(self.board.fen(), White='Player', Black='AI')
 
-        # Initialize speech recognizer
+        # Initialize speech recognizer; without a microphone (headless
+        # runs, benchmarks) voice commands are never received
         self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+        self.microphone = sr.Microphone() if microphone else None
 
     def interpret_command(self, command):
+        global nlp
+        if nlp is None:
+            nlp = spacy.load("en_core_web_sm")
         doc = nlp(command)
         start_square = None
         end_square = None
@@ -57,6 +72,8 @@ class Game:
         return None, None, piece_type, action
 
     def recognize_speech(self):
+        if self.microphone is None:
+            return None
         with self.microphone as source:
             print("Adjusting for ambient noise... Please wait.")
             self.recognizer.adjust_for_ambient_noise(source)
@@ -110,26 +127,43 @@ class Game:
                         self.dragger.drag_piece(piece)
                         self.board.squares[clicked_row][clicked_col].piece = None
             elif event.type == pygame.MOUSEMOTION:
-                if self.dragger.is_dragging():
+                self.set_hover(event.pos[1] // SQSIZE, event.pos[0] // SQSIZE)
+                if self.dragger.dragging:
                     self.dragger.update_mouse(event.pos)
-                    self.show_bg(screen)
-                    self.show_pieces(screen)
-                    self.dragger.update_blit(screen)
             elif event.type == pygame.MOUSEBUTTONUP:
-                if self.dragger.is_dragging():
+                if self.dragger.dragging:
                     self.dragger.update_mouse(event.pos)
                     released_row = event.pos[1] // SQSIZE
                     released_col = event.pos[0] // SQSIZE
                     initial = Square(self.dragger.initial_row, self.dragger.initial_col)
                     final = Square(released_row, released_col)
                     move = Move(initial, final)
-                    self.board.squares[initial.row][initial.col].piece = self.dragger.piece
+                    piece = self.dragger.piece
+                    self.board.squares[initial.row][initial.col].piece = piece
                     self.dragger.undrag_piece()
-                    print(f"Move: {move}")
+                    if self.board.valid_move(piece, move):
+                        self.record_move(piece, move)
+                        self.board.move(piece, move)
+                        self.board.set_true_en_passant(piece)
+                        self.next_turn()
+
+    def record_move(self, piece, move):
+        # SAN depends on the position before the move, so call this first
+        self.pgn.add(self.board.san(piece, move))
+
+    def next_turn(self):
+        self.next_player = 'white' if self.next_player == 'black' else 'black'
+        # decided once per move here, handle_checkmate reads it every frame
+        self.result = game_result(self.board.position)
+        # write the record once the game is decided
+        if self.result != '*':
+            self.pgn.finish(self.result)
 
     def run_game(self):
         pygame.init()
         screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        SPRITES.preload()
+        renderer = Renderer(self, screen)
         clock = pygame.time.Clock()
         running = True
 
@@ -145,37 +179,53 @@ class Game:
             # Handle mouse drag interactions
             self.handle_mouse_drag(screen)
 
-            screen.fill((255, 255, 255))  # White background
-            self.show_bg(screen)
-            self.show_pieces(screen)
-            # Other show methods for displaying game elements
-
-            # Update the popups
-            self.popup.update(screen)
-
-            pygame.display.flip()
+            # Redraw the squares that changed, popups included
+            renderer.render()
             clock.tick(30)  # Frame rate
 
+        self.pgn.finish(game_result(self.board.position))
         pygame.quit()
 
+    def square_rect(self, row, col):
+        return pygame.Rect(col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
+
     def show_bg(self, surface):
+        surface.blit(self.background(surface.get_size()), (0, 0))
+
+    def draw_bg(self, surface, row, col):
+        rect = self.square_rect(row, col)
+        surface.blit(self.background(surface.get_size()), rect, rect)
+
+    def background(self, size):
+        '''
+            Squares and coordinate labels of the current theme, drawn once
+            and reused until the theme or the window size changes
+        '''
+        key = (self.config.theme, size)
+        if self.bg_key != key:
+            self.bg_surface = self.render_bg(size)
+            self.bg_key = key
+        return self.bg_surface
+
+    def render_bg(self, size):
         theme = self.config.theme
-        
+        surface = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+
         for row in range(ROWS):
             for col in range(COLS):
                 # color
                 color = theme.bg.light if (row + col) % 2 == 0 else theme.bg.dark
-                # rect
-                rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
                 # blit
-                pygame.draw.rect(surface, color, rect)
+                pygame.draw.rect(surface, color, self.square_rect(row, col))
 
                 # row coordinates
                 if col == 0:
                     # color
                     color = theme.bg.dark if row % 2 == 0 else theme.bg.light
                     # label
-                    lbl = self.config.font.render(str(ROWS-row), 1, color)
+                    lbl = TEXTS.render(self.config.font, str(ROWS-row), color)
                     lbl_pos = (5, 5 + row * SQSIZE)
                     # blit
                     surface.blit(lbl, lbl_pos)
@@ -185,27 +235,120 @@ class Game:
                     # color
                     color = theme.bg.dark if (row + col) % 2 == 0 else theme.bg.light
                     # label
-                    lbl = self.config.font.render(Square.get_alphacol(col), 1, color)
+                    lbl = TEXTS.render(self.config.font, Square.get_alphacol(col), color)
                     lbl_pos = (col * SQSIZE + SQSIZE - 20, HEIGHT - 20)
                     # blit
                     surface.blit(lbl, lbl_pos)
+        return surface
+
+    def show_last_move(self, surface):
+        if self.board.last_move:
+            for pos in (self.board.last_move.initial, self.board.last_move.final):
+                self.draw_trace(surface, pos.row, pos.col)
+
+    def draw_trace(self, surface, row, col):
+        theme = self.config.theme
+        color = theme.trace.light if (row + col) % 2 == 0 else theme.trace.dark
+        pygame.draw.rect(surface, color, self.square_rect(row, col))
+
+    def show_moves(self, surface):
+        if self.dragger.dragging:
+            for move in self.dragger.piece.moves:
+                self.draw_move(surface, move.final.row, move.final.col)
+
+    def draw_move(self, surface, row, col):
+        theme = self.config.theme
+        color = theme.moves.light if (row + col) % 2 == 0 else theme.moves.dark
+        pygame.draw.rect(surface, color, self.square_rect(row, col))
 
     def show_pieces(self, surface):
         for row in range(ROWS):
             for col in range(COLS):
-                # piece ?
-                if self.board.squares[row][col].has_piece():
-                    piece = self.board.squares[row][col].piece
-                    
-                    # all pieces except dragger piece
-                    if piece is not self.dragger.piece:
-                        piece.set_texture(size=80)
-                        img = pygame.image.load(piece.texture)
-                        img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
-                        piece.texture_rect = img.get_rect(center=img_center)
-                        surface.blit(img, piece.texture_rect)
-
-    # Implement other methods for displaying game elements
+                self.draw_piece(surface, row, col)
+
+    def draw_piece(self, surface, row, col):
+        piece = self.board.squares[row][col].piece
+        # all pieces except dragger piece
+        if piece is not None and piece is not self.dragger.piece:
+            img = SPRITES.get(piece, size=80)
+            img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
+            texture_rect = img.get_rect(center=img_center)
+            surface.blit(img, texture_rect)
+
+    def show_hover(self, surface):
+        if self.hovered_sqr:
+            self.draw_hover(surface, self.hovered_sqr.row, self.hovered_sqr.col)
+
+    def draw_hover(self, surface, row, col):
+        pygame.draw.rect(surface, HOVER_COLOR, self.square_rect(row, col), width=3)
+
+    def show_check(self, surface):
+        square = self.check_square()
+        if square is not None:
+            self.draw_check(surface, *square)
+
+    def check_square(self):
+        # (row, col) of the king of the side to move when it is in check
+        position = self.board.position
+        if position.in_check(position.side):
+            sq = position.king_square(position.side)
+            return sq >> 3, sq & 7
+        return None
+
+    def draw_check(self, surface, row, col):
+        pygame.draw.rect(surface, CHECK_COLOR, self.square_rect(row, col), width=4)
+
+    def draw_square(self, surface, row, col):
+        '''
+            Every layer of a single square, in the order the show_ methods
+            draw the whole board
+        '''
+        self.draw_bg(surface, row, col)
+        last_move = self.board.last_move
+        if last_move and (row, col) in ((last_move.initial.row, last_move.initial.col),
+                                        (last_move.final.row, last_move.final.col)):
+            self.draw_trace(surface, row, col)
+        if self.dragger.dragging and any(move.final.row == row and move.final.col == col
+                                         for move in self.dragger.piece.moves):
+            self.draw_move(surface, row, col)
+        self.draw_piece(surface, row, col)
+        if self.hovered_sqr and (self.hovered_sqr.row, self.hovered_sqr.col) == (row, col):
+            self.draw_hover(surface, row, col)
+        if self.check_square() == (row, col):
+            self.draw_check(surface, row, col)
+
+    # other methods
+
+    def set_hover(self, row, col):
+        if Square.in_range(row, col):
+            self.hovered_sqr = self.board.squares[row][col]
+
+    def change_theme(self):
+        self.config.change_theme()
+
+    def play_sound(self, captured=False):
+        if captured:
+            self.config.capture_sound.play()
+        else:
+            self.config.move_sound.play()
+
+    def reset(self):
+        self.__init__(self.microphone is not None)
+
+    def handle_invalid_move(self, surface):
+        # the dragged piece goes back to its square
+        self.dragger.undrag_piece()
+
+    def handle_checkmate(self, surface):
+        # announce the end of the game once
+        if self.game_over or self.result == '*':
+            return
+        self.game_over = True
+        if self.result == '1/2-1/2':
+            message = 'Draw!'
+        else:
+            message = f'Checkmate! {"White" if self.result == "1-0" else "Black"} wins'
+        self.popup.show_message(surface, message)
 
 if __name__ == "__main__":
     game = Game()
@@ -6,19 +6,30 @@ from game import Game
 from square import Square
 from move import Move
 from ai import AI
+from engine_worker import EngineWorker, AI_MOVE
 from popup import Popup
+from renderer import Renderer, Overlay
+from profiler import TIMERS
+from textures import SPRITES
+from pgn import game_result
 
 class Main:
     def __init__(self):
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption('Chess')
+        # decode the piece images once, now that there is a display to convert to
+        SPRITES.preload()
         self.game = Game()
         self.ai = AI('black')
+        self.engine = EngineWorker(self.ai)
         self.popup = Popup(WIDTH, HEIGHT)
+        self.overlay = Overlay(TIMERS)
+        self.renderer = Renderer(self.game, self.screen, popups=[self.popup], overlay=self.overlay)
         self.recognizer = sr.Recognizer()
         self.microphone = sr.Microphone()
 
+    @TIMERS.timed('speech')
     def recognize_speech(self):
         try:
             with self.microphone as source:
@@ -53,96 +64,92 @@ class Main:
         game = self.game
         board = self.game.board
         dragger = self.game.dragger
+        clock = pygame.time.Clock()
 
         while True:
-            game.show_bg(screen)
-            game.show_last_move(screen)
-            game.show_moves(screen)
-            game.show_pieces(screen)
-            game.show_hover(screen)
-            game.show_check(screen)
-
-            if dragger.dragging:
-                dragger.update_blit(screen)
-
-            for event in pygame.event.get():
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if game.next_player == 'white':  
-                        dragger.update_mouse(event.pos)
-                        clicked_row = dragger.mouseY // SQSIZE
-                        clicked_col = dragger.mouseX // SQSIZE
-
-                        if board.squares[clicked_row][clicked_col].has_piece():
-                            piece = board.squares[clicked_row][clicked_col].piece
-                            if piece.color == game.next_player:
-                                board.calc_moves(piece, clicked_row, clicked_col, bool=True)
-                                dragger.save_initial(event.pos)
-                                dragger.drag_piece(piece)
-                                game.show_bg(screen)
-                                game.show_last_move(screen)
-                                game.show_moves(screen)
-                                game.show_pieces(screen)
-
-                elif event.type == pygame.MOUSEMOTION:
-                    if game.next_player == 'white':
-                        motion_row = event.pos[1] // SQSIZE
-                        motion_col = event.pos[0] // SQSIZE
-                        game.set_hover(motion_row, motion_col)
-                        if dragger.dragging:
+            TIMERS.frame()
+            with TIMERS.stage('events'):
+                for event in pygame.event.get():
+                    if event.type == pygame.MOUSEBUTTONDOWN:
+                        if game.next_player == 'white':  
                             dragger.update_mouse(event.pos)
-                            game.show_bg(screen)
-                            game.show_last_move(screen)
-                            game.show_moves(screen)
-                            game.show_pieces(screen)
-                            game.show_hover(screen)
-                            dragger.update_blit(screen)
-
-                elif event.type == pygame.MOUSEBUTTONUP:
-                    if game.next_player == 'white':
-                        if dragger.dragging:
-                            dragger.update_mouse(event.pos)
-                            released_row = dragger.mouseY // SQSIZE
-                            released_col = dragger.mouseX // SQSIZE
-                            initial = Square(dragger.initial_row, dragger.initial_col)
-                            final = Square(released_row, released_col)
-                            move = Move(initial, final)
-
-                            if board.valid_move(dragger.piece, move):
-                                captured = board.squares[released_row][released_col].has_piece()
-                                board.move(dragger.piece, move)
-                                board.set_true_en_passant(dragger.piece)
+                            clicked_row = dragger.mouseY // SQSIZE
+                            clicked_col = dragger.mouseX // SQSIZE
+
+                            if board.squares[clicked_row][clicked_col].has_piece():
+                                piece = board.squares[clicked_row][clicked_col].piece
+                                if piece.color == game.next_player:
+                                    with TIMERS.stage('calc_moves'):
+                                        board.calc_moves(piece, clicked_row, clicked_col, bool=True)
+                                    dragger.save_initial(event.pos)
+                                    dragger.drag_piece(piece)
+
+                    elif event.type == pygame.MOUSEMOTION:
+                        if game.next_player == 'white':
+                            motion_row = event.pos[1] // SQSIZE
+                            motion_col = event.pos[0] // SQSIZE
+                            game.set_hover(motion_row, motion_col)
+                            if dragger.dragging:
+                                dragger.update_mouse(event.pos)
+
+                    elif event.type == pygame.MOUSEBUTTONUP:
+                        if game.next_player == 'white':
+                            if dragger.dragging:
+                                dragger.update_mouse(event.pos)
+                                released_row = dragger.mouseY // SQSIZE
+                                released_col = dragger.mouseX // SQSIZE
+                                initial = Square(dragger.initial_row, dragger.initial_col)
+                                final = Square(released_row, released_col)
+                                move = Move(initial, final)
+
+                                if board.valid_move(dragger.piece, move):
+                                    game.record_move(dragger.piece, move)
+                                    captured = board.move(dragger.piece, move)
+                                    board.set_true_en_passant(dragger.piece)
+                                    game.play_sound(captured)
+                                    game.next_turn()
+
+                                    if game.next_player == 'black':
+                                        self.engine.start(board)
+                                else:
+                                    self.popup.show_message(screen, "Invalid Move!")
+                                    game.handle_invalid_move(screen)
+                            dragger.undrag_piece()
+
+                    elif event.type == AI_MOVE:
+                        # ignore results of searches cancelled since
+                        if event.search_id == self.engine.search_id and game.next_player == 'black':
+                            if event.code is not None:
+                                ai_move = self.ai.to_move(board, event.code)
+                                ai_piece = board.squares[ai_move.initial.row][ai_move.initial.col].piece
+                                game.record_move(ai_piece, ai_move)
+                                captured = board.move(ai_piece, ai_move)
                                 game.play_sound(captured)
-                                game.show_bg(screen)
-                                game.show_last_move(screen)
-                                game.show_pieces(screen)
                                 game.next_turn()
-
-                                if game.next_player == 'black':
-                                    ai_move = self.ai.get_move(board)
-                                    if ai_move:
-                                        board.move(ai_move.piece, ai_move)
-                                        game.play_sound(ai_move.captured_piece is not None)
-                                        game.show_bg(screen)
-                                        game.show_last_move(screen)
-                                        game.show_pieces(screen)
-                                        game.next_turn()
-                            else:
-                                self.popup.show_message(screen, "Invalid Move!")
-                                game.handle_invalid_move(screen)
-                        dragger.undrag_piece()
-
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_t:
-                        game.change_theme()
-                    if event.key == pygame.K_r:
-                        game.reset()
-                        game = self.game
-                        board = self.game.board
-                        dragger = self.game.dragger()
-
-                elif event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                                # search the expected reply while the player thinks
+                                self.engine.ponder(board, event.code)
+
+                    elif event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_t:
+                            game.change_theme()
+                        if event.key == pygame.K_p:
+                            # timing runs while the overlay shows it
+                            TIMERS.enabled = self.overlay.toggle() or PROFILE
+                        if event.key == pygame.K_r:
+                            self.engine.cancel()
+                            game.pgn.finish(game_result(board.position))
+                            game.reset()
+                            game = self.game
+                            board = self.game.board
+                            dragger = self.game.dragger
+
+                    elif event.type == pygame.QUIT:
+                        self.engine.cancel()
+                        game.pgn.finish(game_result(board.position))
+                        if PROFILE_DUMP:
+                            TIMERS.dump(PROFILE_DUMP)
+                        pygame.quit()
+                        sys.exit()
 
             if game.next_player == 'white':
                 move_str = self.recognize_speech()
@@ -154,30 +161,24 @@ class Main:
                         if piece and piece.color == game.next_player:
                             move = Move(Square(initial_row, initial_col), Square(final_row, final_col))
                             if board.valid_move(piece, move):
-                                board.move(piece, move)
+                                game.record_move(piece, move)
+                                captured = board.move(piece, move)
                                 board.set_true_en_passant(piece)
-                                game.play_sound(False)
-                                game.show_bg(screen)
-                                game.show_last_move(screen)
-                                game.show_pieces(screen)
+                                game.play_sound(captured)
                                 game.next_turn()
 
                                 if game.next_player == 'black':
-                                    ai_move = self.ai.get_move(board)
-                                    if ai_move:
-                                        board.move(ai_move.piece, ai_move)
-                                        game.play_sound(ai_move.captured_piece is not None)
-                                        game.show_bg(screen)
-                                        game.show_last_move(screen)
-                                        game.show_pieces(screen)
-                                        game.next_turn()
+                                    self.engine.start(board)
                             else:
                                 self.popup.show_message(screen, "Invalid Move!")
                                 game.handle_invalid_move(screen)
 
             game.handle_checkmate(screen)
-            self.popup.update(screen)
-            pygame.display.update()
+            # only the squares that changed are redrawn and updated
+            with TIMERS.stage('draw'):
+                self.renderer.render()
+            # cap the frame rate so the engine thread gets the rest of the CPU
+            clock.tick(30)
 
 if __name__ == "__main__":
     main = Main()
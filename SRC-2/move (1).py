@@ -1,3 +1,43 @@
+from square import Square
+
+# packed moves are 16-bit ints: from square (bits 0-5), to square (bits
+# 6-11) and a 4-bit flag (bits 12-15); squares are row * 8 + col
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4 # bit set on every capture
+EN_PASSANT = 5
+PROMOTION = 8 # bit set on every promotion, low two bits pick the piece
+
+PROMOTION_PIECES = 'nbrq' # knight, bishop, rook, queen
+
+def move_to(code):
+    return (code >> 6) & 63
+
+def move_flags(code):
+    return code >> 12
+
+def is_promotion(code):
+    return (code >> 12) & PROMOTION != 0
+
+def promotion_type(code):
+    '''
+        Promotion piece type (1 knight .. 4 queen), 0 if not a promotion
+    '''
+    flags = code >> 12
+    return (flags & 3) + 1 if flags & PROMOTION else 0
+
+def promotion_flags(ptype):
+    return PROMOTION | (ptype - 1)
+
+def to_uci(code):
+    frm, to = code & 63, (code >> 6) & 63
+    uci = (Square.get_alphacol(frm & 7) + str(8 - (frm >> 3))
+           + Square.get_alphacol(to & 7) + str(8 - (to >> 3)))
+    if is_promotion(code):
+        uci += PROMOTION_PIECES[(code >> 12) & 3]
+    return uci
 
 class Move:
 
@@ -13,4 +53,25 @@ class Move:
         return s
 
     def __eq__(self, other):
-        return self.initial == other.initial and self.final == other.final
\ No newline at end of file
+        return self.initial == other.initial and self.final == other.final
+
+    def key(self):
+        # from/to part of a packed move, enough to find it among legal moves
+        return (self.initial.row * 8 + self.initial.col) | ((self.final.row * 8 + self.final.col) << 6)
+
+    @staticmethod
+    def from_code(code, board=None):
+        '''
+            Board Move for a packed move; with a board the final square
+            carries the captured piece like the moves built by calc_moves
+        '''
+        frm, to = code & 63, (code >> 6) & 63
+        initial = Square(frm >> 3, frm & 7)
+        final_piece = None
+        if board is not None:
+            final_piece = board.squares[to >> 3][to & 7].piece
+            # en passant captures the pawn beside the final square
+            if (code >> 12) == EN_PASSANT:
+                final_piece = board.squares[frm >> 3][to & 7].piece
+        final = Square(to >> 3, to & 7, final_piece)
+        return Move(initial, final)
@@ -0,0 +1,159 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from const import *
+from bitboard import Position
+from move import to_uci
+from search import Search, MATE_BOUND
+from evaluation import evaluate
+from transposition import TranspositionTable
+
+# search of the current worker process, kept between moves so its
+# transposition table stays warm
+_worker_search = None
+
+def _init_worker(stop_event, tt_size_mb, evaluate):
+    global _worker_search
+    _worker_search = Search(TranspositionTable(tt_size_mb), stop_event, evaluate)
+
+def _search_root_moves(position, root_moves, max_depth, time_limit, max_nodes):
+    search = _worker_search
+    move = search.search(position, max_depth, time_limit, max_nodes, root_moves)
+    return move, search.score, search.depth, search.nodes, search.pv
+
+class ParallelSearch:
+    '''
+        Root-move splitting search: the legal root moves are dealt out to a
+        pool of worker processes, each runs the normal iterative deepening
+        search on its share, and the best scoring result at the deepest
+        completed depth wins. Has the same search/stop interface and result
+        attributes as Search
+    '''
+
+    def __init__(self, workers=None, tt_size_mb=TT_SIZE_MB, evaluate=evaluate):
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_size_mb = tt_size_mb
+        self.evaluate = evaluate
+        self.stop_event = multiprocessing.Event()
+        self.pool = None
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.pv = []
+
+    def _pool(self):
+        # started lazily so building an AI does not fork processes
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.stop_event, self.tt_size_mb, self.evaluate))
+        return self.pool
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def search(self, position, max_depth=AI_MAX_DEPTH, time_limit=None, max_nodes=None):
+        self.stop_event.clear()
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.pv = []
+        self.best_move = None
+
+        root_moves = position.legal_moves()
+        if not root_moves:
+            return None
+        self.best_move = root_moves[0]
+        if len(root_moves) == 1:
+            return self.best_move
+
+        # deal the moves round-robin after a cheap ordering (captures and
+        # promotions first) so every worker gets a mix of good candidates
+        root_moves.sort(key=lambda move: move >> 12, reverse=True)
+        shares = [root_moves[i::self.workers] for i in range(self.workers)]
+        worker_nodes = max_nodes // len(shares) if max_nodes is not None else None
+        pool = self._pool()
+        futures = [pool.submit(_search_root_moves, position, share, max_depth, time_limit, worker_nodes)
+                   for share in shares if share]
+
+        results = []
+        for future in futures:
+            move, score, depth, nodes, pv = future.result()
+            self.nodes += nodes
+            if move is not None:
+                results.append((move, score, depth, pv))
+
+        # scores are only comparable at the same depth: pick among the
+        # workers that completed the deepest one. A mate score is exact at
+        # any depth (the worker stopped deepening once it found it)
+        best = None
+        if results:
+            deepest = max(depth for _, _, depth, _ in results)
+            best = max((result for result in results if result[2] == deepest or abs(result[1]) > MATE_BOUND),
+                       key=lambda result: (result[1], result[2]))
+
+        if best is not None:
+            self.best_move, self.score, self.depth, self.pv = best
+        return self.best_move
+
+# positions for the speedup benchmark
+BENCH_POSITIONS = [
+    'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    '2r3k1/pp3ppp/2n1b3/3p4/3P4/2N1BN2/PP3PPP/2R3K1 b - - 0 20',
+]
+
+def benchmark(worker_counts, depth, fens=BENCH_POSITIONS, tt_size_mb=TT_SIZE_MB):
+    '''
+        Time a fixed-depth search of every position with one in-process
+        Search and with ParallelSearch at each worker count; returns
+        [(workers, seconds, nodes)]
+    '''
+    results = []
+    for workers in worker_counts:
+        if workers == 1:
+            engine = Search(TranspositionTable(tt_size_mb))
+        else:
+            engine = ParallelSearch(workers, tt_size_mb)
+            # start the processes before timing
+            engine.search(Position.from_fen(fens[0]), max_depth=1)
+
+        elapsed = 0.0
+        nodes = 0
+        for fen in fens:
+            if workers == 1:
+                engine.tt.clear()
+            position = Position.from_fen(fen)
+            start = time.perf_counter()
+            move = engine.search(position, max_depth=depth)
+            elapsed += time.perf_counter() - start
+            nodes += engine.nodes
+            print(f'  workers {workers:>2}  {to_uci(move)}  score {engine.score:>6}  nodes {engine.nodes}')
+
+        if workers != 1:
+            engine.close()
+        results.append((workers, elapsed, nodes))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Speedup of the parallel root-splitting search')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--tt-size-mb', type=float, default=TT_SIZE_MB)
+    args = parser.parse_args()
+
+    results = benchmark(args.workers, args.depth, tt_size_mb=args.tt_size_mb)
+    base = results[0][1]
+    print(f'{"workers":>7}  {"seconds":>8}  {"nodes":>9}  {"nodes/s":>9}  {"speedup":>7}')
+    for workers, elapsed, nodes in results:
+        print(f'{workers:>7}  {elapsed:8.2f}  {nodes:>9}  {nodes / max(elapsed, 1e-9):>9.0f}  {base / max(elapsed, 1e-9):>7.2f}')
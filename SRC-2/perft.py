@@ -0,0 +1,180 @@
+import argparse
+import sys
+import time
+
+import zobrist
+from bitboard import Position
+from move import to_uci
+from evaluation import evaluate, evaluate_full
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# standard perft positions and their known leaf counts for depth 1, 2, ...
+POSITIONS = [
+    ('start', START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('promotion', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('pins', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+def perft(position, depth):
+    '''
+        Number of leaf nodes of the legal move tree to a depth
+    '''
+    moves = position.legal_moves()
+    # bulk counting: the last ply needs no make/unmake
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return nodes
+
+def divide(position, depth):
+    '''
+        Leaf counts below each root move, for finding generator bugs
+    '''
+    counts = {}
+    for move in position.legal_moves():
+        undo = position.make_move(move)
+        counts[to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return counts
+
+def verify(position, depth, errors=None):
+    '''
+        Walk the move tree to a depth checking the incrementally kept hash,
+        pawn hash and evaluation against full recomputation at every node.
+        Returns the list of (fen, what) mismatches
+    '''
+    if errors is None:
+        errors = []
+    checks = (('hash', position.hash, zobrist.compute(position)),
+              ('pawn hash', position.pawn_hash, zobrist.compute_pawns(position)),
+              ('evaluation', evaluate(position), evaluate_full(position)))
+    for what, kept, computed in checks:
+        if kept != computed:
+            errors.append((position.fen(), what))
+    if depth > 0:
+        for move in position.legal_moves():
+            undo = position.make_move(move)
+            verify(position, depth - 1, errors)
+            position.unmake_move(move, undo)
+    return errors
+
+def board_perft(board, depth, color='white'):
+    '''
+        Perft through Board.calc_moves and make/unmake, so the Square/Move
+        adapter is checked along with the core. The board only promotes to
+        queens, so counts differ from the references once promotions occur
+    '''
+    if depth == 0:
+        return 1
+    other = 'black' if color == 'white' else 'white'
+    nodes = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board.squares[row][col].piece
+            if piece is not None and piece.color == color:
+                board.calc_moves(piece, row, col, bool=True)
+                for move in list(piece.moves):
+                    undo = board.make_move(piece, move)
+                    nodes += board_perft(board, depth - 1, other)
+                    board.unmake_move(undo)
+    return nodes
+
+def run_suite(max_depth, max_nodes):
+    '''
+        Compare every standard position against its reference counts, up to
+        max_depth or until the reference count would exceed max_nodes.
+        Returns True when every count matches
+    '''
+    ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in POSITIONS:
+        for depth, reference in enumerate(expected, 1):
+            if depth > max_depth or (depth > 1 and reference > max_nodes):
+                break
+            position = Position.from_fen(fen)
+            start = time.perf_counter()
+            nodes = perft(position, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == reference else f'FAIL (expected {reference})'
+            ok = ok and nodes == reference
+            print(f'{name:<12} depth {depth}  {nodes:>10}  {elapsed:8.3f}s  {nodes / max(elapsed, 1e-9):>10.0f} nps  {status}')
+    print(f'total {total_nodes} nodes in {total_time:.3f}s, {total_nodes / max(total_time, 1e-9):.0f} nodes/second')
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Perft move generator benchmark and correctness suite')
+    parser.add_argument('--fen', help='count a single position instead of the suite')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--max-nodes', type=int,
+                        help='skip suite depths whose reference count exceeds this '
+                             '(default 1000000, 100000 with --verify)')
+    parser.add_argument('--divide', action='store_true', help='print counts per root move')
+    parser.add_argument('--verify', action='store_true',
+                        help='check the incremental hashes and evaluation instead of counting')
+    parser.add_argument('--board', action='store_true',
+                        help='count through Board.calc_moves from the start position')
+    args = parser.parse_args()
+
+    if args.board:
+        from board import Board
+        start = time.perf_counter()
+        nodes = board_perft(Board(), args.depth)
+        elapsed = time.perf_counter() - start
+        reference = POSITIONS[0][2][args.depth - 1] if 0 < args.depth <= len(POSITIONS[0][2]) else None
+        print(f'board depth {args.depth}  {nodes}  {elapsed:.3f}s  {nodes / max(elapsed, 1e-9):.0f} nps'
+              + (f'  expected {reference}' if reference is not None else ''))
+        sys.exit(0 if reference in (None, nodes) else 1)
+
+    if args.verify:
+        if args.fen:
+            positions = [('fen', args.fen, args.depth)]
+        else:
+            # the same cutoff as the suite, with a lower default since every
+            # node is recomputed in full
+            max_nodes = 100000 if args.max_nodes is None else args.max_nodes
+            positions = [(name, fen, max([1] + [depth for depth, reference in enumerate(expected, 1)
+                                                 if depth <= args.depth and reference <= max_nodes]))
+                         for name, fen, expected in POSITIONS]
+        failed = 0
+        for name, fen, depth in positions:
+            start = time.perf_counter()
+            errors = verify(Position.from_fen(fen), depth)
+            elapsed = time.perf_counter() - start
+            print(f'{name:<12} depth {depth}  {len(errors)} mismatches  {elapsed:8.3f}s')
+            for where, what in errors[:5]:
+                print(f'  {what} differs in {where}')
+            failed += len(errors)
+        sys.exit(1 if failed else 0)
+
+    if args.fen:
+        position = Position.from_fen(args.fen)
+        if args.divide:
+            counts = divide(position, args.depth)
+            for name in sorted(counts):
+                print(f'{name}: {counts[name]}')
+            print(f'total {sum(counts.values())}')
+        else:
+            start = time.perf_counter()
+            nodes = perft(position, args.depth)
+            elapsed = time.perf_counter() - start
+            print(f'depth {args.depth}  {nodes}  {elapsed:.3f}s  {nodes / max(elapsed, 1e-9):.0f} nps')
+        sys.exit(0)
+
+    sys.exit(0 if run_suite(args.depth, 1000000 if args.max_nodes is None else args.max_nodes) else 1)
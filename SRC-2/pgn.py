@@ -0,0 +1,326 @@
+import argparse
+import datetime
+import os
+import re
+import sys
+
+from const import *
+from bitboard import Position, WHITE, BLACK, PAWN, QUEEN, square_name, parse_square
+from move import Move, CAPTURE, KING_CASTLE, QUEEN_CASTLE, PROMOTION, promotion_type
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+SAN_PIECES = 'PNBRQK'
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# the seven tag roster, written first and in this order
+ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$')
+ESCAPE_RE = re.compile(r'\\(.)')
+TAG_RE = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+# movetext tokens: comments, variations, NAGs, move numbers, results and moves
+TOKEN_RE = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s(){};]+')
+
+def san(position, code, legal=None):
+    '''
+        Standard algebraic notation of a legal move of the side to move;
+        legal are the position's legal moves when the caller has them
+    '''
+    frm, to, flags = code & 63, (code >> 6) & 63, code >> 12
+    if flags == KING_CASTLE:
+        text = 'O-O'
+    elif flags == QUEEN_CASTLE:
+        text = 'O-O-O'
+    else:
+        piece = position.mailbox[frm]
+        capture = 'x' if flags & CAPTURE else ''
+        if piece % 6 == PAWN:
+            text = (square_name(frm)[0] if capture else '') + capture + square_name(to)
+            if flags & PROMOTION:
+                text += '=' + SAN_PIECES[promotion_type(code)]
+        else:
+            if legal is None:
+                legal = position.legal_moves()
+            # name the file, the rank or both when another piece of the
+            # same kind can reach the square too
+            rivals = [move & 63 for move in legal
+                      if (move >> 6) & 63 == to and move & 63 != frm and position.mailbox[move & 63] == piece]
+            hint = ''
+            if rivals:
+                if all(rival & 7 != frm & 7 for rival in rivals):
+                    hint = square_name(frm)[0]
+                elif all(rival >> 3 != frm >> 3 for rival in rivals):
+                    hint = square_name(frm)[1]
+                else:
+                    hint = square_name(frm)
+            text = SAN_PIECES[piece % 6] + hint + capture + square_name(to)
+
+    undo = position.make_move(code)
+    if position.in_check(position.side):
+        text += '+' if position.legal_moves() else '#'
+    position.unmake_move(code, undo)
+    return text
+
+def parse_san(position, text):
+    '''
+        Packed legal move for a SAN move of the side to move; check marks,
+        annotations and over-specified origins are accepted. Raises
+        ValueError for illegal or ambiguous moves
+    '''
+    token = text.rstrip('+#!?').replace('e.p.', '')
+    legal = position.legal_moves()
+    if token in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flags = KING_CASTLE if len(token) == 3 else QUEEN_CASTLE
+        matches = [move for move in legal if move >> 12 == flags]
+    else:
+        match = SAN_RE.match(token)
+        if match is None:
+            raise ValueError(f'invalid SAN move: {text!r}')
+        letter, file, rank, square, promo = match.groups()
+        ptype = SAN_PIECES.index(letter) if letter else PAWN
+        to = parse_square(square)
+        promo = SAN_PIECES.index(promo.upper()) if promo else 0
+        matches = []
+        for move in legal:
+            frm = move & 63
+            if (move >> 6) & 63 != to or position.mailbox[frm] % 6 != ptype:
+                continue
+            if file is not None and square_name(frm)[0] != file:
+                continue
+            if rank is not None and square_name(frm)[1] != rank:
+                continue
+            if promotion_type(move) != promo:
+                continue
+            matches.append(move)
+    if len(matches) != 1:
+        raise ValueError(f'{"ambiguous" if matches else "illegal"} SAN move: {text!r}')
+    return matches[0]
+
+def game_result(position):
+    '''
+        PGN result of a position: decided on mate, stalemate and the fifty
+        move rule, '*' while the game goes on
+    '''
+    if position.legal_moves():
+        return '1/2-1/2' if position.halfmove >= 100 else '*'
+    if not position.in_check(position.side):
+        return '1/2-1/2'
+    return '0-1' if position.side == WHITE else '1-0'
+
+def escape(value):
+    # tag value with backslashes and quotes escaped, as read_games expects
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def unescape(value):
+    return ESCAPE_RE.sub(r'\1', value)
+
+def format_game(headers, moves, result='*'):
+    '''
+        PGN text of a game from its tags and SAN moves, movetext wrapped at
+        80 columns; a FEN tag sets the first move number and side
+    '''
+    headers = dict(headers)
+    headers['Result'] = result
+    lines = [f'[{name} "{escape(headers.get(name, "?"))}"]' for name in ROSTER]
+    lines += [f'[{name} "{escape(value)}"]' for name, value in headers.items() if name not in ROSTER]
+
+    number, side = 1, WHITE
+    if 'FEN' in headers:
+        fields = headers['FEN'].split()
+        side = WHITE if fields[1] == 'w' else BLACK
+        number = int(fields[5]) if len(fields) >= 6 else 1
+    tokens = []
+    for move in moves:
+        if side == WHITE:
+            tokens.append(f'{number}.')
+        elif not tokens:
+            tokens.append(f'{number}...')
+        tokens.append(move)
+        if side != WHITE:
+            number += 1
+        side ^= 1
+    tokens.append(result)
+
+    text, line = [], ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            text.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    text.append(line)
+    return '\n'.join(lines) + '\n\n' + '\n'.join(text) + '\n\n'
+
+class PGNWriter:
+    '''
+        Records the game being played and appends it to a PGN file when it
+        ends; the file is only created once a game is written
+    '''
+
+    def __init__(self, path=PGN_PATH):
+        self.path = path
+        self.headers = None
+        self.moves = []
+
+    def start(self, fen=None, **tags):
+        '''
+            Start recording a game; tags are PGN tags such as White='Player'
+        '''
+        self.headers = {'Event': 'Casual game', 'Site': '?',
+                        'Date': datetime.date.today().strftime('%Y.%m.%d'), 'Round': '-'}
+        self.headers.update(tags)
+        if fen is not None and fen != START_FEN:
+            self.headers['SetUp'] = '1'
+            self.headers['FEN'] = fen
+        self.moves = []
+
+    def add(self, move):
+        # SAN of the move just played
+        if self.headers is not None:
+            self.moves.append(move)
+
+    def finish(self, result='*'):
+        '''
+            Write the recorded game, if it has any moves, and stop recording
+        '''
+        if self.headers is not None and self.moves:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(format_game(self.headers, self.moves, result))
+        self.headers = None
+        self.moves = []
+
+class PGNGame:
+    '''
+        One game read from a PGN file: its tags, SAN moves and result
+    '''
+
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def fen(self):
+        return self.headers.get('FEN', START_FEN)
+
+    def codes(self):
+        '''
+            Packed moves of the game, replayed on a Position
+        '''
+        position = Position.from_fen(self.fen())
+        for text in self.moves:
+            code = parse_san(position, text)
+            yield code
+            position.make_move(code)
+
+    def boards(self):
+        '''
+            Replay the game on a Board, yielding the board (one object, moved
+            on in place) after every move
+        '''
+        from board import Board
+        board = Board(self.fen())
+        for text in self.moves:
+            code = parse_san(board.position, text)
+            frm = code & 63
+            piece = board.squares[frm >> 3][frm & 7].piece
+            move = Move.from_code(code, board)
+            board.move(piece, move, promotion=promotion_type(code) or QUEEN)
+            board.set_true_en_passant(piece)
+            yield board
+
+def read_games(lines):
+    '''
+        Games from PGN text lines (an open file or any iterable of lines),
+        parsed one at a time so files of any size stream through
+    '''
+    headers, moves, result = {}, [], '*'
+    in_moves = False
+    depth = 0 # variation nesting
+    comment = False # inside a multi-line {comment}
+    for line in lines:
+        line = line.strip()
+        if comment:
+            if '}' not in line:
+                continue
+            line = line.split('}', 1)[1]
+            comment = False
+        if not line or line.startswith('%'):
+            continue
+        if line.startswith('[') and depth == 0:
+            # a tag after movetext starts the next game
+            if in_moves:
+                yield PGNGame(headers, moves, result)
+                headers, moves, result = {}, [], '*'
+                in_moves = False
+            match = TAG_RE.match(line)
+            if match:
+                headers[match.group(1)] = unescape(match.group(2))
+            continue
+
+        in_moves = True
+        for token in TOKEN_RE.findall(line):
+            if token.startswith('{'):
+                comment = not token.endswith('}')
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth or token.startswith(';') or token.startswith('$') or token[0].isdigit() and token.endswith('.'):
+                continue
+            elif token in RESULTS:
+                result = token
+            else:
+                moves.append(token)
+    if in_moves or headers:
+        yield PGNGame(headers, moves, result)
+
+def open_games(path):
+    '''
+        Stream the games of a PGN file
+    '''
+    with open(path, encoding='utf-8', errors='replace') as f:
+        yield from read_games(f)
+
+def round_trip(game):
+    '''
+        True when writing a game and reading it back gives the same tags,
+        moves and result; absent roster tags come back as "?"
+    '''
+    text = format_game(game.headers, game.moves, game.result)
+    copy = next(read_games(text.splitlines()))
+    headers = dict.fromkeys(ROSTER, '?')
+    headers.update(game.headers)
+    headers['Result'] = game.result
+    return copy.headers == headers and copy.moves == game.moves and copy.result == game.result
+
+# tags that need escaping, for the round trip check
+SAMPLE_GAMES = [
+    PGNGame({'Event': 'The "Immortal" game', 'White': 'O\'Neil \\ "Junior"', 'Black': 'AI'},
+            ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'], '*'),
+    PGNGame({'Event': 'C:\\games\\', 'Annotator': '\\"'}, ['d4', 'd5', 'c4'], '1/2-1/2'),
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check that PGN games survive writing and reading back')
+    parser.add_argument('files', nargs='*', help='PGN files to check (default: built-in samples)')
+    args = parser.parse_args()
+
+    games = (game for path in args.files for game in open_games(path)) if args.files else SAMPLE_GAMES
+    checked = failed = 0
+    for game in games:
+        checked += 1
+        try:
+            list(game.codes())
+            ok = round_trip(game)
+        except ValueError as error:
+            ok = False
+            print(f'game {checked}: {error}')
+        if not ok:
+            failed += 1
+            print(f'game {checked} does not round trip: {game.headers}')
+    print(f'{checked} games checked, {failed} failed')
+    sys.exit(1 if failed else 0)
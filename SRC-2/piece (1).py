@@ -1,21 +1,48 @@
-import os
+class PieceKind:
+    '''
+        Immutable engine-side description of a piece: one shared instance
+        per (color, name), see PieceKind.get
+    '''
+
+    __slots__ = ('name', 'color', 'value', 'code')
+
+    NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+    COLORS = ('white', 'black')
+    _kinds = {}
+
+    def __init__(self, name, color, value):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'color', color)
+        object.__setattr__(self, 'value', value)
+        # same numbering as the bitboard core: color * 6 + piece type
+        object.__setattr__(self, 'code', self.COLORS.index(color) * 6 + self.NAMES.index(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PieceKind is immutable')
+
+    def __repr__(self):
+        return f'PieceKind({self.color} {self.name})'
+
+    @classmethod
+    def get(cls, name, color, value=None):
+        kind = cls._kinds.get((name, color))
+        if kind is None:
+            kind = cls(name, color, value)
+            cls._kinds[(name, color)] = kind
+        return kind
 
 class Piece:
 
-    def __init__(self, name, color, value, texture=None, texture_rect=None):
+    __slots__ = ('name', 'color', 'value', 'kind', 'moves', 'moved')
+
+    def __init__(self, name, color, value):
         self.name = name
         self.color = color
         value_sign = 1 if color == 'white' else -1
         self.value = value * value_sign
+        self.kind = PieceKind.get(name, color, self.value)
         self.moves = []
         self.moved = False
-        self.texture = texture
-        self.set_texture()
-        self.texture_rect = texture_rect
-
-    def set_texture(self, size=80):
-        self.texture = os.path.join(
-            f'assets/images/imgs-{size}px/{self.color}_{self.name}.png')
 
     def add_move(self, move):
         self.moves.append(move)
@@ -25,6 +52,8 @@ class Piece:
 
 class Pawn(Piece):
 
+    __slots__ = ('dir', 'en_passant')
+
     def __init__(self, color):
         self.dir = -1 if color == 'white' else 1
         self.en_passant = False
@@ -32,27 +61,43 @@ class Pawn(Piece):
 
 class Knight(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('knight', color, 3.0)
 
 class Bishop(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('bishop', color, 3.001)
 
 class Rook(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('rook', color, 5.0)
 
 class Queen(Piece):
 
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('queen', color, 9.0)
 
 class King(Piece):
 
+    __slots__ = ('left_rook', 'right_rook')
+
     def __init__(self, color):
         self.left_rook = None
         self.right_rook = None
-        super().__init__('king', color, 10000.0)
\ No newline at end of file
+        super().__init__('king', color, 10000.0)
+
+PIECE_CLASSES = {'pawn': Pawn, 'knight': Knight, 'bishop': Bishop, 'rook': Rook, 'queen': Queen, 'king': King}
+
+# the twelve shared kinds, indexed by bitboard piece code (color * 6 + piece type)
+PIECE_KINDS = [cls(color).kind for color in PieceKind.COLORS
+               for cls in (Pawn, Knight, Bishop, Rook, Queen, King)]
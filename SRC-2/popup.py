@@ -1,5 +1,8 @@
 import pygame
 import time
+from collections import deque
+
+from textures import TEXTS
 
 class Popup:
 
@@ -8,20 +11,36 @@ class Popup:
         self.height = height
         self.font = pygame.font.SysFont(None, 48)
         self.popup_duration = 2  # duration in seconds
-        self.message_queue = []
+        # (message, expiry time); every message lasts popup_duration so
+        # the queue is in expiry order
+        self.message_queue = deque()
 
     def show_message(self, surface, message):
-        # Add the message to the queue with the current time
-        self.message_queue.append((message, time.time()))
+        # Add the message to the queue with the time it goes away
+        self.message_queue.append((message, time.time() + self.popup_duration))
 
     def update(self, surface):
+        self.expire()
+        return self.draw(surface)
+
+    def expire(self):
         current_time = time.time()
 
-        # Remove old messages
-        self.message_queue = [(msg, msg_time) for msg, msg_time in self.message_queue if current_time - msg_time < self.popup_duration]
+        # Remove old messages, the oldest are at the front
+        while self.message_queue and self.message_queue[0][1] <= current_time:
+            self.message_queue.popleft()
 
-        # Display all messages in the queue
-        for message, msg_time in self.message_queue:
-            text = self.font.render(message, True, (255, 255, 255))
+    def draw(self, surface):
+        # Display all messages in the queue, returning the areas drawn
+        rects = []
+        for message, expires in self.message_queue:
+            text = TEXTS.render(self.font, message, (255, 255, 255))
             rect = text.get_rect(center=(self.width // 2, self.height // 2))
             surface.blit(text, rect)
+            rects.append(rect)
+        return rects
+
+    def rects(self):
+        # areas the queued messages cover, without drawing them
+        return [TEXTS.render(self.font, message, (255, 255, 255)).get_rect(center=(self.width // 2, self.height // 2))
+                for message, expires in self.message_queue]
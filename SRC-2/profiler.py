@@ -0,0 +1,119 @@
+import csv
+import functools
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from const import *
+
+# shared no-op context, what stage() hands out while timing is off
+NO_TIMING = nullcontext()
+
+class Stage:
+    # times one pass through a with block
+    __slots__ = ('timers', 'name', 'start')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timers.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class Timers:
+    '''
+        Durations of named stages (drawing, events, AI...) and frame times,
+        the last size samples of each kept in ring buffers. While disabled
+        stage() returns a shared no-op context and timed() calls straight
+        through, so the instrumentation can stay in place
+    '''
+
+    def __init__(self, size=PROFILE_SAMPLES, enabled=PROFILE):
+        self.size = size
+        self.enabled = enabled
+        self.samples = {}
+        self.frames = deque(maxlen=size)
+
+    def stage(self, name):
+        '''
+            with timers.stage('draw'): ...
+        '''
+        if not self.enabled:
+            return NO_TIMING
+        return Stage(self, name)
+
+    def timed(self, name):
+        '''
+            Decorator timing every call of a function as a stage
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Stage(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples.setdefault(name, deque(maxlen=self.size))
+        samples.append(seconds)
+
+    def frame(self):
+        # call once per frame
+        if self.enabled:
+            self.frames.append(time.perf_counter())
+
+    def fps(self):
+        frames = self.frames
+        if len(frames) < 2 or frames[-1] == frames[0]:
+            return 0.0
+        return (len(frames) - 1) / (frames[-1] - frames[0])
+
+    def stats(self):
+        '''
+            {stage: (p50, p95, samples)} with times in seconds
+        '''
+        stats = {}
+        for name, samples in list(self.samples.items()):
+            values = sorted(samples)
+            if values:
+                stats[name] = (percentile(values, 50), percentile(values, 95), len(values))
+        return stats
+
+    def clear(self):
+        self.samples.clear()
+        self.frames.clear()
+
+    def dump(self, path):
+        '''
+            Write the samples to path, as CSV (stage,seconds rows) when it
+            ends in .csv and as JSON otherwise
+        '''
+        samples = {name: list(values) for name, values in list(self.samples.items())}
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'seconds'])
+                for name, values in samples.items():
+                    writer.writerows((name, value) for value in values)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'fps': self.fps(), 'samples': samples}, f, indent=1)
+
+def percentile(values, p):
+    # nearest rank of sorted values
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+# shared by the game loop, the AI and the overlay
+TIMERS = Timers()
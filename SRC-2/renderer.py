@@ -0,0 +1,179 @@
+import time
+import pygame
+
+from const import *
+
+class Renderer:
+    '''
+        Draws the board view, repainting only what changed since the last
+        frame: each square's contents (piece, last move, legal move, hover
+        and check highlights, theme) are compared with the previous frame,
+        the dragged piece and popup messages dirty the squares under where
+        they were and where they are, and only those squares are pushed to
+        the screen
+    '''
+
+    def __init__(self, game, surface, popups=(), overlay=None):
+        self.game = game
+        self.surface = surface
+        # popups besides the game's own
+        self.popups = list(popups)
+        # drawn on top of everything while visible, see Overlay
+        self.overlay = overlay
+        self.state = None
+        self.drag_rect = None
+        self.popup_rects = []
+        self.overlay_rect = None
+
+    def invalidate(self):
+        # repaint everything next frame (new display surface, resize)
+        self.state = None
+
+    def render(self):
+        '''
+            Draw the frame and update the changed areas of the display;
+            returns the rects updated
+        '''
+        game = self.game
+        surface = self.surface
+        popups = [game.popup] + self.popups
+        for popup in popups:
+            popup.expire()
+
+        state = self._state()
+        drag_rect = game.dragger.rect() if game.dragger.dragging else None
+        popup_rects = [rect for popup in popups for rect in popup.rects()]
+        overlay = self.overlay if self.overlay is not None and self.overlay.visible else None
+        overlay_changed = overlay is not None and overlay.refresh()
+        overlay_rect = overlay.rect() if overlay is not None else None
+
+        if self.state is None:
+            dirty = set(range(ROWS * COLS))
+        else:
+            dirty = {sq for sq in range(ROWS * COLS) if state[sq] != self.state[sq]}
+            if drag_rect != self.drag_rect:
+                dirty |= self._under(self.drag_rect) | self._under(drag_rect)
+            if popup_rects != self.popup_rects:
+                for rect in self.popup_rects + popup_rects:
+                    dirty |= self._under(rect)
+            if overlay_changed or overlay_rect != self.overlay_rect:
+                dirty |= self._under(self.overlay_rect) | self._under(overlay_rect)
+
+        # overlays are redrawn whole, so every square under one that is
+        # repainted is repainted too (blending them twice would smear them)
+        overlays = popup_rects + [rect for rect in (drag_rect, overlay_rect) if rect]
+        touched = [rect for rect in overlays if dirty & self._under(rect)]
+        for rect in touched:
+            dirty |= self._under(rect)
+
+        for sq in sorted(dirty):
+            game.draw_square(surface, sq // COLS, sq % COLS)
+        if drag_rect in touched:
+            game.dragger.update_blit(surface)
+        if any(rect in touched for rect in popup_rects):
+            for popup in popups:
+                popup.draw(surface)
+        if overlay_rect in touched:
+            overlay.draw(surface)
+
+        self.state = state
+        self.drag_rect = drag_rect
+        self.popup_rects = popup_rects
+        self.overlay_rect = overlay_rect
+
+        if len(dirty) == ROWS * COLS:
+            rects = [surface.get_rect()]
+            pygame.display.update()
+        else:
+            rects = [game.square_rect(sq // COLS, sq % COLS) for sq in sorted(dirty)]
+            if rects:
+                pygame.display.update(rects)
+        return rects
+
+    def _state(self):
+        # what each square shows, compared frame to frame
+        game = self.game
+        theme = game.config.theme
+        squares = game.board.squares
+        dragger = game.dragger
+
+        highlights = [0] * (ROWS * COLS)
+        last_move = game.board.last_move
+        if last_move:
+            highlights[last_move.initial.row * COLS + last_move.initial.col] |= 1
+            highlights[last_move.final.row * COLS + last_move.final.col] |= 1
+        if dragger.dragging:
+            for move in dragger.piece.moves:
+                highlights[move.final.row * COLS + move.final.col] |= 2
+        if game.hovered_sqr:
+            highlights[game.hovered_sqr.row * COLS + game.hovered_sqr.col] |= 4
+        check = game.check_square()
+        if check is not None:
+            highlights[check[0] * COLS + check[1]] |= 8
+
+        state = []
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = squares[row][col].piece
+                if piece is dragger.piece:
+                    piece = None
+                state.append((theme, piece, highlights[row * COLS + col]))
+        return state
+
+    def _under(self, rect):
+        # squares a rect overlaps
+        if rect is None:
+            return set()
+        rect = rect.clip(pygame.Rect(0, 0, WIDTH, HEIGHT))
+        if not rect.width or not rect.height:
+            return set()
+        return {row * COLS + col
+                for row in range(rect.top // SQSIZE, (rect.bottom - 1) // SQSIZE + 1)
+                for col in range(rect.left // SQSIZE, (rect.right - 1) // SQSIZE + 1)}
+
+class Overlay:
+    '''
+        FPS and p50/p95 per stage in the top right corner, text refreshed
+        a few times a second; drawn by the Renderer over the board from profiler Timers
+    '''
+
+    def __init__(self, timers, width=WIDTH):
+        self.timers = timers
+        self.width = width
+        self.font = pygame.font.SysFont('monospace', 14, bold=True)
+        self.visible = False
+        self.surface = None
+        self.updated = 0
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.surface = None
+        return self.visible
+
+    def refresh(self):
+        '''
+            Re-render the text when it is due; True when it changed
+        '''
+        now = time.perf_counter()
+        if self.surface is not None and now - self.updated < OVERLAY_REFRESH:
+            return False
+        self.updated = now
+        lines = [f'{self.timers.fps():6.1f} fps']
+        for name, (p50, p95, count) in sorted(self.timers.stats().items()):
+            lines.append(f'{name:<10} {p50 * 1000:7.2f} {p95 * 1000:7.2f} ms')
+        rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(text.get_width() for text in rendered) + 10
+        height = sum(text.get_height() for text in rendered) + 10
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 170))
+        y = 5
+        for text in rendered:
+            self.surface.blit(text, (5, y))
+            y += text.get_height()
+        return True
+
+    def rect(self):
+        return self.surface.get_rect(topright=(self.width - 5, 5))
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect())
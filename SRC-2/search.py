@@ -0,0 +1,294 @@
+import time
+
+from const import *
+from bitboard import PAWN
+from move import CAPTURE, PROMOTION, promotion_type
+from evaluation import MATERIAL, evaluate
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 100000
+MATE_BOUND = MATE - 1000 # scores beyond this are mates
+INFINITY = MATE + 1
+MAX_PLY = 128
+
+# move ordering bands
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 26
+LOSING_CAPTURE_SCORE = -(1 << 26)
+
+class SearchStopped(Exception):
+    pass
+
+class Search:
+    '''
+        Iterative deepening negamax alpha-beta search with a transposition
+        table, MVV-LVA/SEE/killer/history move ordering and a capture-only
+        quiescence search that skips losing captures
+    '''
+
+    def __init__(self, tt=None, stop_event=None, evaluate=evaluate):
+        self.tt = tt if tt is not None else TranspositionTable()
+        # static evaluation, side to move's point of view
+        self.evaluate = evaluate
+        # optional threading/multiprocessing Event that stops the search
+        # from outside, e.g. from the process that started a worker
+        self.stop_event = stop_event
+        self.stopped = False
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.pv = []
+
+    def stop(self):
+        '''
+            Ask a running search to return its best move so far
+        '''
+        self.stopped = True
+
+    def search(self, position, max_depth=AI_MAX_DEPTH, time_limit=None, max_nodes=None, root_moves=None):
+        '''
+            Search a position and return the best move found (a packed move,
+            or None without legal moves). The search deepens until max_depth,
+            time_limit seconds or max_nodes nodes, whichever comes first.
+            root_moves restricts the moves considered at the root
+        '''
+        self.stopped = False
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.pv = []
+        self.deadline = time.time() + time_limit if time_limit is not None else None
+        self.max_nodes = max_nodes
+        self.killers = [[None, None] for ply in range(MAX_PLY)]
+        self.history = [[0] * 4096 for color in range(2)]
+        self.path = [] # keys of the positions on the current line
+        self.tt.new_search()
+
+        root_moves = list(root_moves) if root_moves is not None else position.legal_moves()
+        if not root_moves:
+            return None
+        self.best_move = root_moves[0]
+
+        for depth in range(1, max_depth + 1):
+            try:
+                self.score = self._root(position, depth, root_moves)
+            except SearchStopped:
+                break
+            self.depth = depth
+            self.pv = self._principal_variation(position)
+            # a forced mate will not get any shorter
+            if abs(self.score) > MATE_BOUND or self.stopped:
+                break
+        return self.best_move
+
+    def _check_limits(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+        if self.stopped:
+            raise SearchStopped
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            self.stopped = True
+            raise SearchStopped
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stopped = True
+            raise SearchStopped
+
+    def _root(self, position, depth, root_moves):
+        alpha, beta = -INFINITY, INFINITY
+        # best move of the previous iteration first
+        root_moves.sort(key=lambda move: self._order_score(position, move, self.best_move, 0), reverse=True)
+        self.path.append(position.hash)
+        try:
+            best_move = None
+            for move in root_moves:
+                undo = position.make_move(move)
+                try:
+                    score = -self._negamax(position, depth - 1, -beta, -alpha, 1)
+                finally:
+                    position.unmake_move(move, undo)
+                if score > alpha:
+                    alpha = score
+                    best_move = move
+                    # a move that beats the previous best is safe to play
+                    # even if this iteration does not finish
+                    self.best_move = move
+        finally:
+            self.path.pop()
+        self.tt.store(position.hash, depth, alpha, EXACT, best_move)
+        return alpha
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_limits()
+
+        # draws by the fifty-move rule or repetition on the current line
+        key = position.hash
+        if position.halfmove >= 100 or key in self.path:
+            return 0
+
+        in_check = position.in_check(position.side)
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiescence(position, alpha, beta, ply)
+
+        # transposition table
+        alpha_orig = alpha
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, bound, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if bound == EXACT:
+                    return tt_score
+                if bound == LOWER and tt_score >= beta:
+                    return tt_score
+                if bound == UPPER and tt_score <= alpha:
+                    return tt_score
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        moves.sort(key=lambda move: self._order_score(position, move, tt_move, ply), reverse=True)
+        best_score = -INFINITY
+        best_move = None
+        self.path.append(key)
+        try:
+            for move in moves:
+                undo = position.make_move(move)
+                try:
+                    score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    position.unmake_move(move, undo)
+
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    # quiet moves that cut off become killers and earn history
+                    if not (move >> 12) & (CAPTURE | PROMOTION):
+                        killers = self.killers[ply]
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self.history[position.side][move & 4095] += depth * depth
+                    break
+        finally:
+            self.path.pop()
+
+        if best_score <= alpha_orig:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, _score_to_tt(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, position, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_limits()
+
+        # stand pat: the side to move may decline every capture
+        stand_pat = self.evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [move for move in position.legal_moves()
+                    if (move >> 12) & (CAPTURE | PROMOTION)]
+        captures.sort(key=lambda move: self._order_score(position, move, None, ply), reverse=True)
+
+        for move in captures:
+            # captures that lose material in the exchange cannot raise alpha
+            # often enough to be worth searching
+            if not (move >> 12) & PROMOTION and self._losing(position, move):
+                continue
+            undo = position.make_move(move)
+            try:
+                score = -self._quiescence(position, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move(move, undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order_score(self, position, move, tt_move, ply):
+        if move == tt_move:
+            return TT_MOVE_SCORE
+        flags = move >> 12
+        if flags & (CAPTURE | PROMOTION):
+            # most valuable victim, least valuable attacker
+            attacker = position.mailbox[move & 63] % 6
+            gain = 0
+            if flags & CAPTURE:
+                victim = position.mailbox[(move >> 6) & 63]
+                # en passant leaves the target square empty
+                gain = MATERIAL[victim % 6] if victim is not None else MATERIAL[PAWN]
+            if flags & PROMOTION:
+                gain += MATERIAL[promotion_type(move)]
+            elif MATERIAL[attacker] > gain:
+                # might lose the piece: order by the exchange, losing
+                # captures after the quiet moves
+                see = position.see(move)
+                if see < 0:
+                    return LOSING_CAPTURE_SCORE + see
+                gain = see
+            return CAPTURE_SCORE + gain * 8 - attacker
+        killers = self.killers[ply]
+        if move == killers[0]:
+            return KILLER_SCORE + 1
+        if move == killers[1]:
+            return KILLER_SCORE
+        return self.history[position.side][move & 4095]
+
+    def _losing(self, position, move):
+        # a capture by a piece worth no more than its victim cannot lose
+        victim = position.mailbox[(move >> 6) & 63]
+        if victim is None or MATERIAL[position.mailbox[move & 63] % 6] <= MATERIAL[victim % 6]:
+            return False
+        return position.see(move) < 0
+
+    def _principal_variation(self, position):
+        pv = []
+        undos = []
+        seen = set()
+        entry = self.tt.probe(position.hash)
+        while entry is not None and entry[3] is not None and position.hash not in seen:
+            move = entry[3]
+            if move not in position.legal_moves():
+                break
+            seen.add(position.hash)
+            pv.append(move)
+            undos.append((move, position.make_move(move)))
+            entry = self.tt.probe(position.hash)
+        for move, undo in reversed(undos):
+            position.unmake_move(move, undo)
+        return pv
+
+def _score_to_tt(score, ply):
+    # mate scores are stored relative to the node, not the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
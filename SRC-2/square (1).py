@@ -1,17 +1,22 @@
 
 class Square:
 
+    __slots__ = ('row', 'col', 'piece')
+
     ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
 
     def __init__(self, row, col, piece=None):
         self.row = row
         self.col = col
         self.piece = piece
-        self.alphacol = self.ALPHACOLS[col]
 
     def __eq__(self, other):
         return self.row == other.row and self.col == other.col
 
+    @property
+    def alphacol(self):
+        return self.ALPHACOLS[self.col]
+
     def has_piece(self):
         return self.piece != None
 
@@ -37,5 +42,4 @@ class Square:
 
     @staticmethod
     def get_alphacol(col):
-        ALPHACOLS = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
-        return ALPHACOLS[col]
\ No newline at end of file
+        return Square.ALPHACOLS[col]
@@ -0,0 +1,81 @@
+import os
+import pygame
+from collections import OrderedDict
+
+from const import *
+
+# shipped piece images by pixel size, named {color}_{name}.png
+IMAGE_DIRS = {80: 'assests/image-80', 128: 'assests/image-128'}
+
+class SpriteCache:
+    '''
+        Piece images decoded once and kept as display-format surfaces, per
+        color, name and size; sizes that are not shipped are scaled down
+        from the nearest larger image
+    '''
+
+    def __init__(self, image_dirs=IMAGE_DIRS):
+        self.image_dirs = image_dirs
+        self.sprites = {}
+
+    def get(self, piece, size=80):
+        key = (piece.color, piece.name, size)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self._load(piece.color, piece.name, size)
+            self.sprites[key] = sprite
+        return sprite
+
+    def preload(self, sizes=(80, 128)):
+        for size in sizes:
+            for color in ('white', 'black'):
+                for name in ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king'):
+                    if (color, name, size) not in self.sprites:
+                        self.sprites[(color, name, size)] = self._load(color, name, size)
+
+    def clear(self):
+        # needed after the display mode changes, converted surfaces belong to it
+        self.sprites.clear()
+
+    def _load(self, color, name, size):
+        larger = [source for source in self.image_dirs if source >= size]
+        source = min(larger) if larger else max(self.image_dirs)
+        image = pygame.image.load(os.path.join(self.image_dirs[source], f'{color}_{name}.png'))
+        if pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+        if source != size:
+            image = pygame.transform.smoothscale(image, (size, size))
+        return image
+
+# shared by every renderer
+SPRITES = SpriteCache()
+
+class TextCache:
+    '''
+        Rendered text surfaces by font, text and color, least recently used
+        dropped first once capacity is reached; the same few labels and
+        messages are drawn over and over and rasterizing them is slow
+    '''
+
+    def __init__(self, capacity=TEXT_CACHE_ENTRIES):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        # pygame.Color is not hashable
+        key = (font, text, color if isinstance(color, str) else tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, antialias, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+# shared by popups and board labels
+TEXTS = TextCache()
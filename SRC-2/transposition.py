@@ -0,0 +1,72 @@
+from const import *
+
+# bound types of a stored score
+EXACT = 0
+LOWER = 1 # score is at least this (fail high)
+UPPER = 2 # score is at most this (fail low)
+
+# rough CPython cost of one slot: the key int, the entry tuple and two list slots
+ENTRY_BYTES = 128
+
+class TranspositionTable:
+    '''
+        Fixed-size hash table of search results indexed by Zobrist key.
+        A slot is overwritten when it is empty, holds the same position,
+        was stored by an older search, or was searched less deeply
+    '''
+
+    def __init__(self, size_mb=TT_SIZE_MB):
+        # largest power of two number of slots that fits the budget
+        slots = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size # (depth, score, bound, move, generation)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        '''
+            Age the table so entries of earlier searches become replaceable
+        '''
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        '''
+            (depth, score, bound, move) stored for a key, or None
+        '''
+        self.probes += 1
+        idx = key & self.mask
+        if self.keys[idx] == key:
+            entry = self.entries[idx]
+            if entry is not None:
+                self.hits += 1
+                return entry[:4]
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        idx = key & self.mask
+        entry = self.entries[idx]
+        if (entry is None or self.keys[idx] == key
+                or entry[4] != self.generation or depth >= entry[0]):
+            # keep the old best move when the new result has none
+            if move is None and entry is not None and self.keys[idx] == key:
+                move = entry[3]
+            self.keys[idx] = key
+            self.entries[idx] = (depth, score, bound, move, self.generation)
+
+    def hashfull(self):
+        '''
+            Per-mille of the first thousand slots used by the current search
+        '''
+        sample = self.entries[:1000]
+        used = sum(1 for entry in sample if entry is not None and entry[4] == self.generation)
+        return used * 1000 // len(sample)
@@ -0,0 +1,48 @@
+import random
+
+# fixed seed so keys, and any hashes written to disk, are the same on every run
+_rng = random.Random(0x5A0B7157)
+
+# one key per (color * 6 + piece type, square)
+PIECE_KEYS = [[_rng.getrandbits(64) for sq in range(64)] for code in range(12)]
+
+SIDE_KEY = _rng.getrandbits(64)
+
+# piece keys of the pawns only (zero for other pieces), for the pawn-structure hash
+PAWN_KEYS = [PIECE_KEYS[code] if code % 6 == 0 else [0] * 64 for code in range(12)]
+
+# one key per castling right, combined for every 4-bit rights mask
+_castling_bits = [_rng.getrandbits(64) for right in range(4)]
+CASTLING_KEYS = [0] * 16
+for rights in range(16):
+    for bit in range(4):
+        if rights & (1 << bit):
+            CASTLING_KEYS[rights] ^= _castling_bits[bit]
+
+# en passant is keyed by file
+EP_KEYS = [_rng.getrandbits(64) for col in range(8)]
+
+def compute(position):
+    '''
+        Full Zobrist hash of a position; Position keeps it incrementally
+    '''
+    key = 0
+    for sq, code in enumerate(position.mailbox):
+        if code is not None:
+            key ^= PIECE_KEYS[code][sq]
+    if position.side:
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[position.castling]
+    if position.ep is not None:
+        key ^= EP_KEYS[position.ep & 7]
+    return key
+
+def compute_pawns(position):
+    '''
+        Zobrist hash of the pawns alone; Position keeps it incrementally
+    '''
+    key = 0
+    for sq, code in enumerate(position.mailbox):
+        if code is not None:
+            key ^= PAWN_KEYS[code][sq]
+    return key